@@ -1,3 +1,4 @@
+import logging
 from flask import Flask
 from flask_cors import CORS
 from routes.user_routes import user_bp
@@ -5,34 +6,52 @@ from routes.trip_routes import trip_bp
 from routes.event_routes import event_bp
 from routes.place_routes import place_bp
 from routes.admin_routes import admin_bp
+from metrics import init_metrics
+from query_log import init_query_log
+from json_provider import FastJSONProvider
+from database import init_read_routing, WRITE_TOKEN_HEADER
+from startup import init_health, warm_up
 
-app = Flask(__name__)
-app.json.ensure_ascii = False 
-CORS(app) # 加上這行，允許前端 React 連進來
+def create_app(warm=True):
+    # 應用程式工廠：warm=True 時在回傳前完成預熱 (連線池、衍生資料表、景點索引)，
+    # 預熱失敗的階段由 /readyz 之後重試
+    app = Flask(__name__)
+    app.logger.setLevel(logging.INFO) # 啟動階段耗時、raw-sql 執行記錄等 INFO 訊息
+    app.json = FastJSONProvider(app) # 原生處理 timedelta / Decimal / datetime，且 ensure_ascii=False
+    CORS(app, expose_headers=[WRITE_TOKEN_HEADER]) # 加上這行，允許前端 React 連進來
+    init_read_routing(app) # 讀寫分離：寫入後回傳寫入時間，供之後的讀取改走主庫
+    init_metrics(app) # 各路由延遲與 DB 耗時，輸出於 /metrics
+    init_query_log(app) # 每個請求的 SQL 次數、慢查詢與 N+1 偵測
+    init_health(app) # /healthz 與 /readyz
 
-# 註冊藍圖，並加上前綴詞
-app.register_blueprint(user_bp, url_prefix='/api/users')
-app.register_blueprint(trip_bp, url_prefix='/api/trips')
-app.register_blueprint(event_bp, url_prefix='/api')
-app.register_blueprint(place_bp, url_prefix='/api')
-app.register_blueprint(admin_bp, url_prefix='/api')
+    # 註冊藍圖，並加上前綴詞
+    app.register_blueprint(user_bp, url_prefix='/api/users')
+    app.register_blueprint(trip_bp, url_prefix='/api/trips')
+    app.register_blueprint(event_bp, url_prefix='/api')
+    app.register_blueprint(place_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
 
-@app.route('/')
-def index():
-    return "旅遊規劃系統後端運作中"
+    @app.route('/')
+    def index():
+        return "旅遊規劃系統後端運作中"
 
-# 增加一個測試資料庫連線的路由
-@app.route('/test-db')
-def test_db():
-    from database import get_db_connection
-    try:
-        conn = get_db_connection()
-        conn.close()
-        return "資料庫連線成功！"
-    except Exception as e:
-        return f"資料庫連線失敗：{str(e)}"
+    # 增加一個測試資料庫連線的路由
+    @app.route('/test-db')
+    def test_db():
+        from database import get_db_connection
+        try:
+            conn = get_db_connection()
+            conn.close()
+            return "資料庫連線成功！"
+        except Exception as e:
+            return f"資料庫連線失敗：{str(e)}"
+
+    if warm:
+        warm_up(app)
+    return app
 
 if __name__ == '__main__':
     # host='0.0.0.0' 讓 Flask 聽取所有網路介面的請求
     # port=5000 是預設埠號
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # 正式環境請以工廠啟動，例如：gunicorn "app:create_app()"
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,46 @@
+from quart import Quart, request
+from werkzeug.exceptions import HTTPException
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from json_provider import FastJSONProvider
+from async_database import init_async_pool, close_async_pool
+from metrics import init_async_metrics
+from query_log import init_async_query_log
+from routes.async_routes import async_bp
+
+# asyncio 版本的進入點 (需安裝 quart、aiomysql、asgiref 與 ASGI 伺服器)：
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000
+# 高流量讀取路由由 async_bp 以 aiomysql 非同步處理，同一個行程可同時服務大量請求；
+# 其他 URL 轉交原本的 Flask app (在執行緒池中執行)，兩者共用記憶體內的索引與快取。
+
+quart_app = Quart(__name__)
+quart_app.json = FastJSONProvider(quart_app)
+init_async_metrics(quart_app, request) # 延遲與 DB 耗時併入 Flask app 的 /metrics
+init_async_query_log(quart_app, request) # SQL 次數、慢查詢與 N+1 偵測
+quart_app.register_blueprint(async_bp, url_prefix='/api')
+
+@quart_app.before_serving
+async def startup():
+    await init_async_pool()
+
+@quart_app.after_serving
+async def shutdown():
+    await close_async_pool()
+
+@quart_app.after_request
+async def add_cors_headers(response):
+    # 與 app.py 的 CORS(app) 預設行為一致
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+flask_app = create_app()
+flask_fallback = WsgiToAsgi(flask_app)
+_url_adapter = quart_app.url_map.bind('localhost')
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        try:
+            _url_adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return await flask_fallback(scope, receive, send)
+    return await quart_app(scope, receive, send)
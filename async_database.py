@@ -0,0 +1,62 @@
+import time
+import aiomysql
+from config import Config
+from database import notify_query
+
+# asyncio 版的連線池 (aiomysql)，供 asgi.py 的非同步路由使用。
+# execute / fetch 的耗時與同步版 InstrumentedCursor 一樣通知 database.query_listeners
+# (metrics、query_log)。只連主庫：讀寫分離 (database.init_read_routing) 尚未套用到這裡。
+_pool = None
+
+async def init_async_pool():
+    global _pool
+    if _pool is None:
+        _pool = await aiomysql.create_pool(
+            host=Config.MYSQL_HOST,
+            port=Config.MYSQL_PORT,
+            user=Config.MYSQL_USER,
+            password=Config.MYSQL_PASSWORD,
+            db=Config.MYSQL_DB,
+            minsize=1,
+            maxsize=Config.ASYNC_DB_POOL_SIZE,
+            autocommit=True,
+            charset='utf8mb4'
+        )
+    return _pool
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+async def _timed(kind, sql, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        notify_query(kind, sql, time.perf_counter() - start)
+
+async def fetch_all(sql, params=()):
+    async with _pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await _timed('execute', sql, cursor.execute(sql, params))
+            return await _timed('fetch', sql, cursor.fetchall())
+
+async def fetch_one(sql, params=()):
+    async with _pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await _timed('execute', sql, cursor.execute(sql, params))
+            return await _timed('fetch', sql, cursor.fetchone())
+
+def get_async_pool_stats():
+    if _pool is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "maxsize": _pool.maxsize,
+        "size": _pool.size,
+        "idle": _pool.freesize,
+        "in_use": _pool.size - _pool.freesize,
+    }
@@ -0,0 +1,201 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from bench.seed import DEFAULTS
+
+# 對執行中的後端逐一壓測每個藍圖路由，輸出每條路由的吞吐量與 p50 / p99。
+# 用法 (先以 bench.seed 灌好資料並啟動 app.py 或 asgi.py)：
+#   python -m bench.load --base-url http://localhost:5000 --concurrency 32 --requests 2000
+#   python -m bench.load --scale 0.01 --compare bench/results.json
+# 結果寫入 --output (預設 bench/results.json)，格式固定排序，兩次執行的差異可直接 diff。
+# 寫入與刪除類路由會改動資料，比較結果前請重新灌資料。
+# 後台維護路由 (整表重算 / 校正) 只送一次；刪除類路由排在最後，避免先刪掉其他路由要測的資料。
+
+# 路由選項 (scenario 第 5 欄)
+ONCE = "once"                # 只送一次請求、不併發
+DESTRUCTIVE = "destructive"  # 排在所有路由之後執行
+
+def _scenarios(sizes):
+    users, places, trips, events = sizes["users"], sizes["places"], sizes["trips"], sizes["events"]
+    counter = iter(range(1, 1 << 62))
+    lock = threading.Lock()
+
+    def uid():
+        return random.randint(1, users)
+
+    def unique():
+        with lock:
+            return next(counter)
+
+    def event_body():
+        return {"day_no": 1, "title": "壓測活動", "start_time": "09:00:00", "end_time": "10:00:00",
+                "place_name": "壓測景點", "cost": 100, "category": "餐飲"}
+
+    def import_body():
+        # 一半新名稱、一半既有名稱 (大小寫不同，應被視為重複略過)
+        n = unique()
+        lines = [{"name": f"壓測匯入{time.time_ns()}-{n}-{i}"} for i in range(25)]
+        existing = [random.randint(1, places) for _ in range(25)]
+        lines += [{"name": f"景點{i} spot {i}"} for i in existing]
+        return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode()
+
+    def trip_body():
+        return {"title": "壓測行程", "start_date": "2024-06-01", "start_time": "08:00",
+                "end_date": "2024-06-03", "end_time": "20:00", "note": "", "total_budget": 10000}
+
+    # (名稱, 方法, 路徑產生器, body 產生器, 選項)
+    return [
+        # user_bp
+        ("user.register", "POST", lambda: "/api/users/register",
+         lambda: {"name": "bench", "email": f"new{time.time_ns()}-{unique()}@bench.local", "password": "bench"}),
+        ("user.login", "POST", lambda: "/api/users/login",
+         lambda: {"email": f"user{uid()}@bench.local", "password": "bench"}),
+        ("user.update", "POST", lambda: "/api/users/User",
+         lambda: {"id": uid(), "name": f"bench{unique()}"}),
+        # trip_bp
+        ("trip.list", "GET", lambda: f"/api/trips/{uid()}", None),
+        ("trip.create", "POST", lambda: f"/api/trips/{uid()}", trip_body),
+        ("trip.update", "PUT", lambda: f"/api/trips/{random.randint(1, trips)}", trip_body),
+        ("trip.summary", "GET", lambda: f"/api/trips/{random.randint(1, trips)}/summary", None),
+        ("trip.export_json", "GET", lambda: f"/api/trips/{random.randint(1, trips)}/export", None),
+        ("trip.export_ics", "GET", lambda: f"/api/trips/{random.randint(1, trips)}/export?format=ics", None),
+        ("trip.export_user", "GET", lambda: f"/api/trips/users/{uid()}/export", None),
+        ("trip.delete", "DELETE", lambda: f"/api/trips/{random.randint(1, trips)}", None, DESTRUCTIVE),
+        # event_bp
+        ("event.list", "GET", lambda: f"/api/trips/{random.randint(1, trips)}/events", None),
+        ("event.batch_user", "GET", lambda: f"/api/users/{uid()}/trips/events", None),
+        ("event.batch_ids", "GET",
+         lambda: "/api/trips/events?ids=" + ",".join(str(random.randint(1, trips)) for _ in range(30)), None),
+        ("event.add", "POST", lambda: f"/api/events/{random.randint(1, trips)}", event_body),
+        ("event.bulk", "POST", lambda: f"/api/events/{random.randint(1, trips)}/bulk",
+         lambda: [event_body() for _ in range(20)]),
+        ("event.update", "PUT", lambda: f"/api/events/{random.randint(1, events)}", event_body),
+        ("event.delete", "DELETE", lambda: f"/api/events/{random.randint(1, events)}", None, DESTRUCTIVE),
+        # place_bp
+        ("place.search", "GET", lambda: f"/api/places?q={random.randint(1, places)}&limit=20", None),
+        ("place.leaderboard", "GET", lambda: f"/api/places/leaderboard?by={random.choice(['score', 'favorites'])}", None),
+        ("place.autocomplete", "GET", lambda: f"/api/places/autocomplete?q=%E6%99%AF%E9%BB%9E{random.randint(1, 99)}", None),
+        ("place.favorite_toggle", "POST", lambda: "/api/favorites",
+         lambda: {"user_id": uid(), "place_id": random.randint(1, places)}),
+        ("place.favorites", "GET", lambda: f"/api/users/{uid()}/favorites", None),
+        ("place.review_get", "GET", lambda: f"/api/users/{uid()}/places/{random.randint(1, places)}/review", None),
+        ("place.review_post", "POST", lambda: f"/api/users/{uid()}/places/{random.randint(1, places)}/review",
+         lambda: {"score": random.randint(1, 5), "comment": "壓測"}),
+        ("place.review_delete", "DELETE", lambda: f"/api/users/{uid()}/reviews/{random.randint(1, places)}", None,
+         DESTRUCTIVE),
+        ("place.admin_add", "POST", lambda: "/api/admin/places",
+         lambda: {"name": f"壓測景點{time.time_ns()}-{unique()}"}),
+        ("place.admin_import", "POST", lambda: "/api/admin/places/import?format=ndjson", import_body),
+        ("place.admin_delete", "DELETE", lambda: f"/api/admin/places/{random.randint(1, places)}", None, DESTRUCTIVE),
+        # admin_bp
+        ("admin.raw_sql", "POST", lambda: "/api/admin/raw-sql",
+         lambda: {"query": f"SELECT id, name FROM places WHERE id = {random.randint(1, places)}"}),
+        ("admin.db_pool", "GET", lambda: "/api/admin/db-pool", None),
+        ("admin.cache", "GET", lambda: "/api/admin/cache", None),
+        ("admin.query_stats", "GET", lambda: "/api/admin/query-stats", None),
+        ("admin.review_stats_rebuild", "POST", lambda: "/api/admin/review-stats/rebuild", None, ONCE),
+        ("admin.user_counters_check", "POST", lambda: "/api/admin/user-counters/check", None, ONCE),
+        ("admin.expense_rollups_rebuild", "POST", lambda: "/api/admin/expense-rollups/rebuild", None, ONCE),
+    ]
+
+def _request(base_url, method, path, body):
+    # body 為 bytes 時視為 NDJSON 原樣送出 (批次匯入)，其餘以 JSON 編碼
+    if isinstance(body, bytes):
+        data, content_type = body, 'application/x-ndjson'
+    else:
+        data, content_type = (json.dumps(body).encode() if body is not None else None), 'application/json'
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', content_type)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except Exception:
+        status = 0
+    return time.perf_counter() - start, status
+
+def _option(scenario):
+    return scenario[4] if len(scenario) > 4 else None
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def run_route(base_url, scenario, requests, concurrency):
+    name, method, path_fn, body_fn = scenario[:4]
+    if _option(scenario) == ONCE:
+        requests, concurrency = 1, 1
+
+    def one(_):
+        return _request(base_url, method, path_fn(), body_fn() if body_fn else None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for _, status in results if status == 0 or status >= 500)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def compare(old, new):
+    for name, cur in new["routes"].items():
+        prev = old.get("routes", {}).get(name)
+        if not prev:
+            continue
+        def pct(key):
+            return (cur[key] - prev[key]) / prev[key] * 100 if prev[key] else 0.0
+        print(f"{name:<30} rps {pct('throughput_rps'):+7.1f}%   p50 {pct('p50_ms'):+7.1f}%   p99 {pct('p99_ms'):+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="逐路由壓測")
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help="每條路由送出的請求數")
+    parser.add_argument('--scale', type=float, default=1.0, help="需與 bench.seed 使用的倍數相同")
+    parser.add_argument('--routes', default='', help="只測指定路由，以逗號分隔 (如 trip.list,event.list)")
+    parser.add_argument('--output', default='bench/results.json')
+    parser.add_argument('--compare', help="與先前的結果檔比較")
+    args = parser.parse_args()
+
+    random.seed(20240601)
+    sizes = {k: max(1, int(v * args.scale)) for k, v in DEFAULTS.items()}
+    selected = {r.strip() for r in args.routes.split(',') if r.strip()}
+    report = {
+        "config": {"concurrency": args.concurrency, "requests": args.requests, "scale": args.scale},
+        "routes": {},
+    }
+    # sorted 為穩定排序：非刪除類路由維持原順序，刪除類移到最後
+    for scenario in sorted(_scenarios(sizes), key=lambda s: _option(s) == DESTRUCTIVE):
+        if selected and scenario[0] not in selected:
+            continue
+        result = run_route(args.base_url, scenario, args.requests, args.concurrency)
+        report["routes"][scenario[0]] = result
+        print(f"{scenario[0]:<30} {result['throughput_rps']:>9.1f} rps   "
+              f"p50 {result['p50_ms']:>8.2f} ms   p99 {result['p99_ms']:>8.2f} ms   errors {result['errors']}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+if __name__ == '__main__':
+    main()
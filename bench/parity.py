@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import sys
+import urllib.error
+import urllib.request
+from bench.seed import DEFAULTS
+
+# 比對同步版 (app.py) 與 asyncio 版 (asgi.py) 的回應是否一致：同一組請求分別送給兩個後端，
+# 比較狀態碼、JSON 內容與 ETag，並以同步版的 ETag 向 async 版送條件式請求，確認也回 304。
+# 兩個後端需連到同一個以 bench.seed 灌好資料的 MySQL (或相容的替身，如 MariaDB / TiDB)：
+#   python -m bench.seed --reset --scale 0.01
+#   flask --app "app:create_app()" run --port 5000   # 不要開 debug (debug 時 JSON 會縮排，內容 ETag 不同)
+#   uvicorn asgi:application --port 5001             # 或 hypercorn asgi:application --bind :5001
+#   python -m bench.parity --sync-url http://localhost:5000 --async-url http://localhost:5001 --scale 0.01
+# 只送讀取請求，不改動資料；有任何不一致時以非 0 結束。
+
+# (名稱, 方法, 路徑產生器, body 產生器, ETag 是否跨行程一致)
+# 景點關鍵字搜尋的 ETag 帶各 worker 的索引版本，只比對內容
+def _scenarios(sizes):
+    users, places, trips = sizes["users"], sizes["places"], sizes["trips"]
+
+    def uid():
+        return random.randint(1, users)
+
+    return [
+        ("user.login", "POST", lambda: "/api/users/login",
+         lambda: {"email": f"user{uid()}@bench.local", "password": "bench"}, False),
+        ("user.login_failed", "POST", lambda: "/api/users/login",
+         lambda: {"email": f"user{uid()}@bench.local", "password": "wrong"}, False),
+        ("trip.list", "GET", lambda: f"/api/trips/{uid()}", None, True),
+        ("trip.list_fields", "GET", lambda: f"/api/trips/{uid()}?limit=5&fields=id,title,start_datetime", None, True),
+        ("trip.list_bad_fields", "GET", lambda: f"/api/trips/{uid()}?fields=password", None, False),
+        ("event.list", "GET", lambda: f"/api/trips/{random.randint(1, trips)}/events", None, True),
+        ("place.latest", "GET", lambda: "/api/places?limit=20", None, True),
+        ("place.search", "GET", lambda: f"/api/places?q={random.randint(1, places)}&limit=20", None, False),
+        ("place.favorites", "GET", lambda: f"/api/users/{uid()}/favorites", None, True),
+        ("place.review_get", "GET",
+         lambda: f"/api/users/{uid()}/places/{random.randint(1, places)}/review", None, False),
+    ]
+
+def _request(base_url, method, path, body, headers=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=headers or {})
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.headers.get('ETag'), resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), e.read()
+
+def _json(raw):
+    try:
+        return json.loads(raw) if raw else None
+    except ValueError:
+        return raw
+
+def check(sync_url, async_url, scenario):
+    # 回傳不一致的說明 (list)，一致時為空
+    name, method, path_fn, body_fn, shared_etag = scenario
+    path = path_fn()
+    body = body_fn() if body_fn else None
+    s_status, s_tag, s_raw = _request(sync_url, method, path, body)
+    a_status, a_tag, a_raw = _request(async_url, method, path, body)
+
+    problems = []
+    if s_status != a_status:
+        problems.append(f"狀態碼 {s_status} != {a_status}")
+    if _json(s_raw) != _json(a_raw):
+        problems.append("內容不同")
+    if shared_etag and s_status == 200:
+        if s_tag != a_tag:
+            problems.append(f"ETag {s_tag} != {a_tag}")
+        else:
+            status, _, _ = _request(async_url, method, path, body, {'If-None-Match': s_tag})
+            if status != 304:
+                problems.append(f"帶同步版 ETag 的條件式請求回 {status}")
+    return [f"{name} {method} {path}: {p}" for p in problems]
+
+def main():
+    parser = argparse.ArgumentParser(description="比對同步版與 async 版的回應")
+    parser.add_argument('--sync-url', default='http://localhost:5000')
+    parser.add_argument('--async-url', default='http://localhost:5001')
+    parser.add_argument('--samples', type=int, default=50, help="每條路由比對的請求數")
+    parser.add_argument('--scale', type=float, default=1.0, help="需與 bench.seed 使用的倍數相同")
+    args = parser.parse_args()
+
+    random.seed(20240601)
+    sizes = {k: max(1, int(v * args.scale)) for k, v in DEFAULTS.items()}
+    failures = []
+    for scenario in _scenarios(sizes):
+        matched = 0
+        for _ in range(args.samples):
+            problems = check(args.sync_url, args.async_url, scenario)
+            matched += not problems
+            failures += problems
+        print(f"{scenario[0]:<24} {matched:>5}/{args.samples} 一致")
+
+    for line in failures[:50]:
+        print(line)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import random
+import time
+import mysql.connector
+from config import Config
+
+# 壓測用資料：在本機 MySQL (或相容的替身，如 MariaDB / TiDB) 灌入接近正式環境的資料量。
+# 用法 (於專案根目錄)：
+#   python -m bench.seed --reset                 # 預設約 10 萬使用者 / 100 萬行程 / 1000 萬活動
+#   python -m bench.seed --reset --scale 0.01    # 縮小 100 倍，適合本機快速跑
+# 資料由固定的亂數種子產生，每次灌出的內容相同，壓測結果才能互相比較。
+# 使用者帳號為 user<id>@bench.local，密碼皆為 bench。
+
+DEFAULTS = {
+    "users": 100_000,
+    "places": 20_000,
+    "trips": 1_000_000,
+    "events": 10_000_000,  # 每筆活動另有一筆帳目
+    "reviews": 1_000_000,
+    "favorites": 500_000,
+}
+BATCH = 5000
+CATEGORIES = ['交通', '住宿', '餐飲', '門票', '購物', '其他']
+TABLES = ['expenses', 'events', 'reviews', 'favorites', 'trips', 'places', 'users',
+          'place_review_stats', 'user_counters', 'trip_expense_rollups']
+
+def _insert(conn, sql, rows):
+    # 以 executemany 分批寫入 (mysql-connector 會改寫成多列 INSERT)
+    cursor = conn.cursor()
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            cursor.executemany(sql, batch)
+            conn.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    cursor.close()
+    return total
+
+def _pairs(count, users, places, offset):
+    # 產生不重複的 (user, place)：同一使用者的第 k 筆落在不同景點
+    for i in range(count):
+        u, k = i % users, i // users
+        yield u + 1, (u * 37 + k + offset) % places + 1
+
+def reset(conn):
+    cursor = conn.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        cursor.execute(f"SHOW TABLES LIKE '{table}'")
+        if cursor.fetchone():
+            cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.close()
+
+def seed(conn, sizes):
+    rnd = random.Random(20240601)
+    n_users, n_places, n_trips = sizes["users"], sizes["places"], sizes["trips"]
+    events_per_trip = max(1, sizes["events"] // n_trips)
+
+    steps = [
+        ("users", "INSERT INTO users (id, name, email, password) VALUES (%s, %s, %s, %s)",
+         ((i, f"bench{i}", f"user{i}@bench.local", "bench") for i in range(1, n_users + 1))),
+        ("places", "INSERT INTO places (id, name) VALUES (%s, %s)",
+         ((i, f"景點{i} Spot {i}") for i in range(1, n_places + 1))),
+        ("trips", """INSERT INTO trips (id, Users_id, title, start_datetime, end_datetime, note, total_budget)
+                     VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+         ((i, (i - 1) % n_users + 1, f"行程{i}",
+           f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d} 08:00:00",
+           f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d} 20:00:00",
+           '', rnd.randint(1, 100) * 1000)
+          for i in range(1, n_trips + 1))),
+        ("events", """INSERT INTO events (id, Trips_id, day_no, title, start_time, end_time, place_name)
+                      VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+         ((i, (i - 1) // events_per_trip + 1, (i - 1) % events_per_trip // 3 + 1, f"活動{i}",
+           f"{8 + (i % 3) * 4:02d}:00:00", f"{10 + (i % 3) * 4:02d}:00:00",
+           f"景點{(i % n_places) + 1}")
+          for i in range(1, n_trips * events_per_trip + 1))),
+        ("expenses", "INSERT INTO expenses (Trips_id, Events_id, amount, category) VALUES (%s, %s, %s, %s)",
+         (((i - 1) // events_per_trip + 1, i, rnd.randint(0, 5000), CATEGORIES[i % len(CATEGORIES)])
+          for i in range(1, n_trips * events_per_trip + 1))),
+        ("reviews", "INSERT INTO reviews (Users_id, Places_id, score, comment) VALUES (%s, %s, %s, %s)",
+         ((u, p, rnd.randint(1, 5), '') for u, p in _pairs(sizes["reviews"], n_users, n_places, 0))),
+        ("favorites", "INSERT INTO favorites (Users_id, Places_id) VALUES (%s, %s)",
+         _pairs(sizes["favorites"], n_users, n_places, 11)),
+    ]
+    for name, sql, rows in steps:
+        start = time.perf_counter()
+        total = _insert(conn, sql, rows)
+        print(f"{name:<10} {total:>10} 筆  {time.perf_counter() - start:8.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="灌入壓測資料")
+    parser.add_argument('--host', default=Config.MYSQL_HOST)
+    parser.add_argument('--port', type=int, default=Config.MYSQL_PORT)
+    parser.add_argument('--user', default=Config.MYSQL_USER)
+    parser.add_argument('--password', default=Config.MYSQL_PASSWORD)
+    parser.add_argument('--db', default=Config.MYSQL_DB)
+    parser.add_argument('--scale', type=float, default=1.0, help="所有資料量乘上此倍數")
+    parser.add_argument('--reset', action='store_true', help="先清空相關資料表")
+    args = parser.parse_args()
+
+    sizes = {k: max(1, int(v * args.scale)) for k, v in DEFAULTS.items()}
+    conn = mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                   password=args.password, database=args.db)
+    try:
+        if args.reset:
+            reset(conn)
+        seed(conn, sizes)
+
+        # 衍生資料表 (評分彙總、使用者計數) 依新資料重算
+        import review_stats
+        import user_counters
+        import expense_rollups
+        review_stats.rebuild(conn)
+        user_counters.check_and_repair(conn)
+        expense_rollups.rebuild(conn)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+_registry = {}
+
+class TTLCache:
+    # 有容量上限的 LRU 快取，每筆資料另有存活秒數 (ttl 為 0 表示不過期)
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> [到期時間, value, etag]
+        # 最近失效的 key -> 失效時間；副本可能還沒複寫到這次異動，
+        # 這段期間內從副本讀到的結果不寫回快取 (見 set 的 replica 參數)
+        self._tombstones = OrderedDict()
+        self._cleared_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+        _registry[name] = self
+
+    def _lookup(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if not item[0] or item[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def get(self, key):
+        item = self._lookup(key)
+        return item[1] if item else None
+
+    def get_with_etag(self, key):
+        # 回傳 (value, etag)；etag 可能為 None (尚未輸出過回應)，由呼叫端補上
+        item = self._lookup(key)
+        if item is None:
+            return None, None
+        return item[1], item[2]
+
+    def set_etag(self, key, value, etag):
+        # 只在這筆仍是同一個 value 時記下 etag，避免蓋到之後更新過的內容
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] is value:
+                item[2] = etag
+
+    def _recently_invalidated(self, key, now):
+        window = Config.DB_READ_YOUR_WRITES_SECONDS
+        while self._tombstones:
+            oldest_key, at = next(iter(self._tombstones.items()))
+            if now - at < window and len(self._tombstones) <= self.maxsize:
+                break
+            del self._tombstones[oldest_key]
+        at = max(self._tombstones.get(key, 0.0), self._cleared_at)
+        return bool(at) and now - at < window
+
+    def set(self, key, value, etag=None, replica=False):
+        # replica=True 表示 value 讀自唯讀副本：該 key 剛失效時略過回填，
+        # 避免把副本上尚未複寫的舊資料放回快取，一直存活到 ttl
+        now = time.monotonic()
+        expires_at = now + self.ttl if self.ttl else 0
+        with self._lock:
+            if replica and self._recently_invalidated(key, now):
+                self.stale_fills += 1
+                return
+            self._data[key] = [expires_at, value, etag]
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, fn, etag=None, expect_etag=None):
+        # 在鎖內對現有的值做讀-改-寫，回傳是否有這筆資料；fn 不可修改傳入的值，
+        # 回傳新值 (保留原到期時間、etag 換成傳入的 etag) 或 None (讓這筆失效)。
+        # 指定 expect_etag 時，現有 etag 不同代表快取內容不是預期的版本，直接失效
+        with self._lock:
+            item = self._data.get(key)
+            now = time.monotonic()
+            if item is None or (item[0] and item[0] <= now):
+                return False
+            if expect_etag is not None and item[2] != expect_etag:
+                value = None
+            else:
+                value = fn(item[1])
+            if value is None:
+                del self._data[key]
+                self._tombstones[key] = now
+                self._tombstones.move_to_end(key)
+                self.invalidations += 1
+            else:
+                # 換一個新的 list，已被 get_with_etag 拿走的舊項目不受影響
+                self._data[key] = [item[0], value, etag]
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._tombstones[key] = time.monotonic()
+            self._tombstones.move_to_end(key)
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tombstones.clear()
+            self._cleared_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills,
+            }
+
+def get_cache_stats():
+    return {name: c.stats() for name, c in _registry.items()}
+
+# 行程活動清單：key 為 trip_id，內容為 get_trip_events 的完整 data
+trip_events_cache = TTLCache('trip_events', Config.TRIP_EVENTS_CACHE_SIZE, Config.TRIP_EVENTS_CACHE_TTL)
+
+# 使用者收藏清單：key 為 user_id，內容為 [{place_id, name}, ...]
+user_favorites_cache = TTLCache('user_favorites', Config.USER_FAVORITES_CACHE_SIZE, Config.USER_FAVORITES_CACHE_TTL)
@@ -0,0 +1,41 @@
+import hashlib
+from flask import request, current_app
+
+# 條件式 GET：回應帶 ETag，請求的 If-None-Match 相符時直接回 304，
+# 不查資料庫也不序列化 JSON。
+# 預設使用 Flask 的 request / current_app；asgi 的 Quart 路由傳入自己的 req / app
+# (兩者的 app.json 皆為 FastJSONProvider)。
+
+def etag_matches(tag, req=None):
+    return bool(tag) and (request if req is None else req).if_none_match.contains_weak(tag)
+
+def not_modified(tag, app=None):
+    response = (current_app if app is None else app).response_class(b'', status=304)
+    response.set_etag(tag)
+    return response
+
+def bytes_etag(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def json_with_etag(body, tag=None, app=None):
+    # tag 為 None 時由 JSON provider 輸出的位元組算出，不另外序列化一次
+    app = current_app if app is None else app
+    data = app.json.response_bytes(body)
+    response = app.response_class(data, mimetype=app.json.mimetype)
+    response.set_etag(tag or bytes_etag(data))
+    return response
+
+def conditional_json(body, tag=None, req=None, app=None):
+    # 回傳 (response, tag)；If-None-Match 相符時 response 為 304
+    if etag_matches(tag, req):
+        return not_modified(tag, app), tag
+    response = json_with_etag(body, tag, app)
+    tag = response.get_etag()[0]
+    if etag_matches(tag, req):
+        return not_modified(tag, app), tag
+    return response, tag
+
+def derive_etag(*parts):
+    # 由版本號與查詢參數組出 ETag
+    raw = '|'.join(str(p) for p in parts).encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
@@ -3,4 +3,66 @@ class Config:
     MYSQL_PORT = 3306
     MYSQL_USER = 'root'
     MYSQL_PASSWORD = '113368136'
-    MYSQL_DB = 'mydb'
\ No newline at end of file
+    MYSQL_DB = 'mydb'
+
+    # 連線池設定：關閉時每次請求都重新建立連線
+    DB_POOL_ENABLED = True
+    DB_POOL_NAME = 'trip_pool'
+    DB_POOL_SIZE = 10          # 常駐連線數 (mysql-connector 上限 32)
+    DB_POOL_MAX_OVERFLOW = 5   # 連線池用完時，最多再臨時建立幾條連線
+    DB_POOL_TIMEOUT = 5        # 等待可用連線的秒數，逾時拋出 PoolError
+    PREPARED_STATEMENTS_ENABLED = True  # 熱門查詢以伺服器端 prepared statement 執行 (prepared_statements.py)
+    # prepared statement 專用連線池的常駐連線數 (主庫與每個副本各一組)；
+    # 登入、行程活動、收藏等最熱門的讀取都走這組連線，不應小於 DB_POOL_SIZE
+    DB_STMT_POOL_SIZE = 10
+
+    # 唯讀副本：GET 請求的讀取輪流分給這些主機 (帳密、資料庫名稱與主庫相同)，留空則全部走主庫
+    # 例：[{'host': '127.0.0.1', 'port': 3307}, {'host': '127.0.0.1', 'port': 3308}]
+    MYSQL_REPLICAS = []
+    DB_REPLICA_POOL_SIZE = 10
+    DB_READ_YOUR_WRITES_SECONDS = 5  # 寫入後多久內的讀取改走主庫 (需大於副本的複寫延遲)
+
+    # 景點名稱搜尋索引 (記憶體內 n-gram)，定期重建以同步其他 worker 的異動
+    PLACE_INDEX_ENABLED = True
+    PLACE_INDEX_REFRESH_SECONDS = 300
+
+    # 熱門景點排行榜：依平均分排名需至少幾則評論、每次最多回傳幾名 (隨景點索引定期與資料表重新對齊)
+    LEADERBOARD_MIN_REVIEWS = 5
+    LEADERBOARD_MAX_K = 100
+
+    # 行程活動快取 (get_trip_events)：最多保留幾個行程、每筆存活秒數
+    TRIP_EVENTS_CACHE_SIZE = 1024
+    TRIP_EVENTS_CACHE_TTL = 60
+
+    # /api/admin/raw-sql 串流模式：最多回傳幾筆、每次從 cursor 讀取幾筆
+    RAW_SQL_STREAM_MAX_ROWS = 100000
+    RAW_SQL_STREAM_BATCH = 500
+
+    # /api/admin/raw-sql 防護：執行前先 EXPLAIN，全表掃描預估超過此列數即拒絕 (帶 force 則只警告)；
+    # 執行逾時 (毫秒；SELECT 交由 MySQL max_execution_time 中斷，其他指令逾時送 KILL QUERY)、
+    # 未寫 LIMIT 的 SELECT 自動限制的筆數、同時執行上限
+    RAW_SQL_GUARD_ENABLED = True
+    RAW_SQL_MAX_SCAN_ROWS = 100000
+    RAW_SQL_TIMEOUT_MS = 5000
+    RAW_SQL_AUTO_LIMIT = 1000
+    RAW_SQL_MAX_CONCURRENT = 2
+
+    # 查詢記錄：單次 execute / fetch 超過此毫秒數寫入慢查詢記錄；
+    # 同一個 SQL 樣板在一次請求內執行超過此次數視為 N+1；開啟 DB_DEBUG_HEADERS 時回應帶上查詢次數 header
+    SLOW_QUERY_MS = 200
+    N_PLUS_ONE_THRESHOLD = 10
+    DB_DEBUG_HEADERS = False
+
+    # asgi.py 非同步路由使用的 aiomysql 連線池大小
+    ASYNC_DB_POOL_SIZE = 50
+
+    # 使用者收藏清單快取 (get_my_favorites)，由 toggle_favorite 即時更新
+    USER_FAVORITES_CACHE_SIZE = 4096
+    USER_FAVORITES_CACHE_TTL = 300
+
+    # 景點批次匯入：每批寫入筆數
+    PLACE_IMPORT_CHUNK = 1000
+
+    # 行程匯出：每次從未緩衝 cursor 讀取幾筆、同時進行的匯出上限 (每個匯出在下載期間佔用一條連線)
+    TRIP_EXPORT_BATCH = 500
+    TRIP_EXPORT_MAX_CONCURRENT = 4
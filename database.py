@@ -1,11 +1,354 @@
+import itertools
+import threading
+import time
 import mysql.connector
+from flask import g, has_request_context, request
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
 from config import Config
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=Config.MYSQL_HOST,
-        port=Config.MYSQL_PORT,
+# 讀寫分離：寫入一律走主庫 (Config.MYSQL_HOST)，GET / HEAD 請求的讀取輪流分給 Config.MYSQL_REPLICAS。
+# 請求中有 commit 時，回應會帶上寫入時間 (header 與 cookie)；
+# 之後的讀取請求只要帶回的寫入時間還在 DB_READ_YOUR_WRITES_SECONDS 內就改讀主庫，確保讀得到自己剛寫入的資料。
+READ_METHODS = ('GET', 'HEAD')
+WRITE_TOKEN_HEADER = 'X-DB-Write-At'
+WRITE_TOKEN_COOKIE = 'db_write_at'
+
+# 每次 execute / fetch 完成後呼叫 listener(kind, sql, seconds)，kind 為 'execute' 或 'fetch'
+# (metrics.py 用來統計每個路由的 DB 往返次數與時間)
+query_listeners = []
+
+def _connect_args(host=None, port=None):
+    return dict(
+        host=host or Config.MYSQL_HOST,
+        port=port or Config.MYSQL_PORT,
         user=Config.MYSQL_USER,
         password=Config.MYSQL_PASSWORD,
         database=Config.MYSQL_DB
-    )
\ No newline at end of file
+    )
+
+class HostPool:
+    # 單一資料庫主機的連線池：常駐連線 + 溢出連線，並以 semaphore 限制同時借出的總數
+    def __init__(self, name, connect_args, size, max_overflow, primary, reset_session=True):
+        self.name = name
+        self.connect_args = connect_args
+        self.size = size
+        self.max_overflow = max_overflow
+        self.primary = primary
+        # 歸還時是否 reset session；prepared statement 專用連線池需保留 statement，不 reset
+        self.reset_session = reset_session
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None  # 限制同時借出的連線數 (常駐 + 溢出)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "pooled_in_use": 0,
+            "overflow_in_use": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_total_ms": 0.0,
+            "wait_max_ms": 0.0,
+        }
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._slots = threading.BoundedSemaphore(self.size + self.max_overflow)
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=self.name,
+                        pool_size=self.size,
+                        pool_reset_session=self.reset_session,
+                        **self.connect_args
+                    )
+        return self._pool
+
+    def get_connection(self):
+        if not Config.DB_POOL_ENABLED:
+            return ConnectionProxy(mysql.connector.connect(**self.connect_args), self.primary)
+
+        pool = self._get_pool()
+
+        # 1. 等待名額，超過 DB_POOL_TIMEOUT 秒就放棄
+        start = time.perf_counter()
+        acquired = self._slots.acquire(timeout=Config.DB_POOL_TIMEOUT)
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["wait_total_ms"] += wait_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], wait_ms)
+            if not acquired:
+                self._stats["timeouts"] += 1
+        if not acquired:
+            raise PoolError(f"等待資料庫連線逾時 ({Config.DB_POOL_TIMEOUT} 秒)")
+
+        # 2. 優先使用常駐連線，連線池用完才建立溢出連線
+        try:
+            try:
+                conn, overflow = pool.get_connection(), False
+            except PoolError:
+                conn, overflow = mysql.connector.connect(**self.connect_args), True
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            if overflow:
+                self._stats["overflow_in_use"] += 1
+            else:
+                self._stats["pooled_in_use"] += 1
+        return PooledConnection(conn, self, overflow)
+
+    def warm(self):
+        # 建立連線池 (mysql-connector 建立時即連上全部常駐連線)
+        if Config.DB_POOL_ENABLED:
+            self._get_pool()
+
+    def check(self):
+        # 健康檢查：只借用已建立的閒置常駐連線並 ping，不另外建立新連線；回傳 (是否正常, 說明)
+        if not Config.DB_POOL_ENABLED:
+            return True, "未啟用連線池"
+        if self._pool is None:
+            return False, "連線池尚未建立"
+        if not self._slots.acquire(blocking=False):
+            return True, "連線全部使用中"
+        try:
+            try:
+                conn = self._pool.get_connection()
+            except PoolError:
+                return True, "連線全部使用中"
+            try:
+                conn.ping(reconnect=False)
+                return True, "ok"
+            except Exception as e:
+                return False, str(e)
+            finally:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    def release(self, overflow):
+        with self._stats_lock:
+            if overflow:
+                self._stats["overflow_in_use"] -= 1
+            else:
+                self._stats["pooled_in_use"] -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        return {
+            "enabled": Config.DB_POOL_ENABLED,
+            "host": f"{self.connect_args['host']}:{self.connect_args['port']}",
+            "pool_size": self.size,
+            "max_overflow": self.max_overflow,
+            "in_use": stats["pooled_in_use"] + stats["overflow_in_use"],
+            "overflow_in_use": stats["overflow_in_use"],
+            "idle": self.size - stats["pooled_in_use"] if self._pool is not None else 0,
+            "checkouts": checkouts,
+            "timeouts": stats["timeouts"],
+            "avg_wait_ms": round(stats["wait_total_ms"] / checkouts, 3) if checkouts else 0.0,
+            "max_wait_ms": round(stats["wait_max_ms"], 3),
+        }
+
+def _host_pools(suffix, primary_size, replica_size, reset_session):
+    primary = HostPool(f"{Config.DB_POOL_NAME}{suffix}", _connect_args(), primary_size,
+                       Config.DB_POOL_MAX_OVERFLOW, primary=True, reset_session=reset_session)
+    replicas = [
+        HostPool(f"{Config.DB_POOL_NAME}{suffix}_replica{i}",
+                 _connect_args(replica.get('host'), replica.get('port')),
+                 replica_size, Config.DB_POOL_MAX_OVERFLOW, primary=False, reset_session=reset_session)
+        for i, replica in enumerate(Config.MYSQL_REPLICAS)
+    ]
+    return primary, replicas, (itertools.cycle(replicas) if replicas else None)
+
+# 一般連線池：歸還時 reset session，raw-sql 等留下的 session 狀態不會帶到下一次借出
+_primary, _replicas, _replica_cycle = _host_pools('', Config.DB_POOL_SIZE, Config.DB_REPLICA_POOL_SIZE, True)
+# prepared statement 專用連線池：只執行 prepared_statements.HOT_QUERIES，不 reset session 以保留 statement
+_stmt_primary, _stmt_replicas, _stmt_replica_cycle = _host_pools(
+    '_stmt', Config.DB_STMT_POOL_SIZE, Config.DB_STMT_POOL_SIZE, False)
+_replica_cycle_lock = threading.Lock()
+
+_routing_lock = threading.Lock()
+_routing = {"primary_checkouts": 0, "replica_checkouts": 0, "read_your_writes": 0, "replica_fallbacks": 0}
+
+def _count(key):
+    with _routing_lock:
+        _routing[key] += 1
+
+def notify_query(kind, sql, seconds):
+    for listener in query_listeners:
+        listener(kind, sql, seconds)
+
+class InstrumentedCursor:
+    # 包裝 cursor：execute / fetch 的耗時通知 query_listeners，其餘屬性照舊
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _timed(self, kind, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            notify_query(kind, self._sql, time.perf_counter() - start)
+
+    def execute(self, operation, *args, **kwargs):
+        self._sql = operation
+        return self._timed('execute', self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        self._sql = operation
+        return self._timed('execute', self._cursor.executemany, operation, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed('fetch', self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed('fetch', self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed('fetch', self._cursor.fetchall)
+
+class ConnectionProxy:
+    # 包裝連線：cursor() 回傳 InstrumentedCursor；主庫連線 commit 時記下寫入時間，其餘屬性照舊
+    def __init__(self, conn, primary=True):
+        self._conn = conn
+        self.is_replica = not primary
+        self.is_overflow = False  # 連線池溢出的臨時連線 (用完即關閉)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        self._conn.commit()
+        if not self.is_replica and has_request_context():
+            g.db_write_at = time.time()
+
+    def discard(self):
+        # 放棄還沒讀完的結果：直接斷開實體連線 (不讀完剩餘資料、不送 QUIT)，再照常 close()；
+        # 連線池下次借出這條連線時會自動重新連線
+        raw = self._conn
+        try:
+            getattr(raw, '_cnx', raw).shutdown()
+        except Exception:
+            pass
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class PooledConnection(ConnectionProxy):
+    # 借出的連線：close() 時歸還連線池 (溢出連線則真正關閉) 並釋放名額
+    def __init__(self, conn, host_pool, overflow):
+        super().__init__(conn, host_pool.primary)
+        self._host_pool = host_pool
+        self.is_overflow = overflow
+        self._closed = False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if not self.is_overflow and not self._host_pool.reset_session:
+                # 沒有 reset session，歸還前結束未完成的交易 (含唯讀查詢開啟的快照)
+                try:
+                    if self._conn.in_transaction:
+                        self._conn.rollback()
+                except Exception:
+                    pass
+            self._conn.close()
+        finally:
+            self._host_pool.release(self.is_overflow)
+
+def _recent_write():
+    # 用戶端帶回的寫入時間 (header 優先，其次 cookie) 是否仍在複寫延遲的容許範圍內
+    token = request.headers.get(WRITE_TOKEN_HEADER) or request.cookies.get(WRITE_TOKEN_COOKIE)
+    try:
+        return time.time() - float(token) < Config.DB_READ_YOUR_WRITES_SECONDS
+    except (TypeError, ValueError):
+        return False
+
+def _use_replica():
+    if not _replicas or not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if g.get('db_write_at') is not None or _recent_write():
+        _count("read_your_writes")
+        return False
+    return True
+
+def get_db_connection(readonly=None, statements=False):
+    # readonly=None 時依目前的請求決定：GET / HEAD 且沒有近期寫入才讀副本，
+    # 請求外 (啟動、CLI、背景工作) 一律使用主庫
+    # statements=True 時改借 prepared statement 專用連線池，只能用來執行 prepared_statements 的熱門查詢
+    if readonly is None:
+        readonly = _use_replica()
+    primary, replica_cycle = _primary, _replica_cycle
+    if statements and Config.PREPARED_STATEMENTS_ENABLED:
+        primary, replica_cycle = _stmt_primary, _stmt_replica_cycle
+    if readonly and replica_cycle is not None:
+        with _replica_cycle_lock:
+            replica = next(replica_cycle)
+        try:
+            conn = replica.get_connection()
+            _count("replica_checkouts")
+            return conn
+        except Exception:
+            # 副本連不上或名額用完時改讀主庫
+            _count("replica_fallbacks")
+    conn = primary.get_connection()
+    _count("primary_checkouts")
+    return conn
+
+def init_read_routing(app):
+    # 有寫入的請求回傳寫入時間，讓同一位使用者接下來的讀取改走主庫
+    @app.after_request
+    def _issue_write_token(response):
+        written = g.get('db_write_at')
+        if written is not None and _replicas:
+            token = f"{written:.3f}"
+            response.headers[WRITE_TOKEN_HEADER] = token
+            response.set_cookie(WRITE_TOKEN_COOKIE, token, httponly=True, samesite='Lax',
+                                max_age=int(Config.DB_READ_YOUR_WRITES_SECONDS) + 1)
+        return response
+
+def warm_pools():
+    # 主庫失敗才算預熱失敗；副本盡力而為 (連不上時讀取退回主庫，下次借用時再建立連線池)
+    _primary.warm()
+    if Config.PREPARED_STATEMENTS_ENABLED:
+        _stmt_primary.warm()
+    for replica in _replicas + (_stmt_replicas if Config.PREPARED_STATEMENTS_ENABLED else []):
+        try:
+            replica.warm()
+        except Exception:
+            pass
+
+def check_pools():
+    # 回傳 (主庫是否正常, 各主機的檢查結果)；副本異常時讀取會退回主庫，不影響整體狀態
+    primary_ok, primary_detail = _primary.check()
+    results = {"primary": {"ok": primary_ok, "detail": primary_detail}}
+    for i, replica in enumerate(_replicas):
+        ok, detail = replica.check()
+        results[f"replica{i}"] = {"ok": ok, "detail": detail}
+    return primary_ok, results
+
+def get_pool_stats():
+    stats = _primary.stats()
+    with _routing_lock:
+        stats["routing"] = dict(_routing)
+    stats["replicas"] = [replica.stats() for replica in _replicas]
+    if Config.PREPARED_STATEMENTS_ENABLED:
+        stats["statement_pools"] = [_stmt_primary.stats()] + [replica.stats() for replica in _stmt_replicas]
+    return stats
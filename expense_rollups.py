@@ -0,0 +1,150 @@
+import sys
+from collections import defaultdict
+from decimal import Decimal
+from database import get_db_connection
+
+# 每個 (行程, 第幾天, 類別) 的花費小計與筆數，由活動的新增/修改/刪除增量維護，
+# 預算摘要只需讀取這張表，與行程內的活動數量無關。
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS trip_expense_rollups (
+        Trips_id INT NOT NULL,
+        day_no INT NOT NULL,
+        category VARCHAR(50) NOT NULL,
+        total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        event_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (Trips_id, day_no, category),
+        FOREIGN KEY (Trips_id) REFERENCES trips(id) ON DELETE CASCADE
+    )
+"""
+
+UPSERT_SQL = """
+    INSERT INTO trip_expense_rollups (Trips_id, day_no, category, total_amount, event_count)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        total_amount = total_amount + VALUES(total_amount),
+        event_count = event_count + VALUES(event_count)
+"""
+
+def ensure_table(cursor):
+    # 回傳 True 代表資料表是這次才建立，需要先 rebuild 一次
+    cursor.execute("SHOW TABLES LIKE 'trip_expense_rollups'")
+    exists = cursor.fetchone() is not None
+    if not exists:
+        cursor.execute(CREATE_TABLE_SQL)
+    return not exists
+
+def _key(trip_id, day_no, category):
+    return (trip_id, int(day_no or 1), category or '其他')
+
+def _amount(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+class RollupDelta:
+    # 累積多筆異動後一次寫入 (同一個 key 只送一列)
+    def __init__(self):
+        self._deltas = defaultdict(lambda: [Decimal(0), 0])
+
+    def add(self, trip_id, day_no, category, amount):
+        d = self._deltas[_key(trip_id, day_no, category)]
+        d[0] += _amount(amount)
+        d[1] += 1
+
+    def remove(self, trip_id, day_no, category, amount):
+        d = self._deltas[_key(trip_id, day_no, category)]
+        d[0] -= _amount(amount)
+        d[1] -= 1
+
+    def apply(self, cursor):
+        rows = [k + (v[0], v[1]) for k, v in self._deltas.items() if v[0] or v[1]]
+        if rows:
+            cursor.executemany(UPSERT_SQL, rows)
+        self._deltas.clear()
+
+def get_trip_summary(cursor, trip_id):
+    # 回傳 None 代表行程不存在
+    cursor.execute("SELECT total_budget FROM trips WHERE id = %s", (trip_id,))
+    trip = cursor.fetchone()
+    if not trip:
+        return None
+    budget = _amount(trip['total_budget'] if isinstance(trip, dict) else trip[0])
+
+    cursor.execute("""
+        SELECT day_no, category, total_amount, event_count
+        FROM trip_expense_rollups
+        WHERE Trips_id = %s AND event_count > 0
+        ORDER BY day_no ASC, category ASC
+    """, (trip_id,))
+    rows = cursor.fetchall()
+
+    by_day = {}
+    by_category = defaultdict(Decimal)
+    for row in rows:
+        day_no, category, total, count = (
+            (row['day_no'], row['category'], row['total_amount'], row['event_count'])
+            if isinstance(row, dict) else row
+        )
+        day = by_day.setdefault(day_no, {"day_no": day_no, "total_amount": Decimal(0), "categories": []})
+        day["total_amount"] += total
+        day["categories"].append({"category": category, "total_amount": total, "event_count": count})
+        by_category[category] += total
+
+    total_spent = sum(by_category.values(), Decimal(0))
+    return {
+        "total_budget": budget,
+        "total_spent": total_spent,
+        "remaining": budget - total_spent,
+        "over_budget": total_spent > budget,
+        "budget_used_ratio": float(total_spent / budget) if budget else None,
+        "by_day": list(by_day.values()),
+        "by_category": [
+            {"category": c, "total_amount": t} for c, t in sorted(by_category.items())
+        ]
+    }
+
+def rebuild(conn):
+    # 從 events / expenses 一次重算所有小計
+    cursor = conn.cursor()
+    try:
+        ensure_table(cursor)
+        cursor.execute("DELETE FROM trip_expense_rollups")
+        cursor.execute("""
+            INSERT INTO trip_expense_rollups (Trips_id, day_no, category, total_amount, event_count)
+            SELECT e.Trips_id, COALESCE(e.day_no, 1), COALESCE(ex.category, '其他'),
+                   SUM(COALESCE(ex.amount, 0)), COUNT(*)
+            FROM events e
+            JOIN expenses ex ON ex.Events_id = e.id
+            GROUP BY e.Trips_id, COALESCE(e.day_no, 1), COALESCE(ex.category, '其他')
+        """)
+        rebuilt = cursor.rowcount
+        conn.commit()
+        return rebuilt
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def init_expense_rollups():
+    conn = get_db_connection(readonly=False)
+    cursor = conn.cursor()
+    try:
+        created = ensure_table(cursor)
+    finally:
+        cursor.close()
+    try:
+        if created:
+            rebuild(conn)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    # 用法：python expense_rollups.py rebuild
+    if sys.argv[1:] != ['rebuild']:
+        print("用法：python expense_rollups.py rebuild")
+        sys.exit(1)
+    conn = get_db_connection(readonly=False)
+    try:
+        print(f"已重算 {rebuild(conn)} 筆花費小計")
+    finally:
+        conn.close()
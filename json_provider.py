@@ -0,0 +1,55 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, timedelta
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準函式庫
+    orjson = None
+
+# 直接在序列化時處理 timedelta / Decimal / datetime / date，路由不需要再逐列轉換。
+# 輸出格式與 Flask 預設一致：datetime、date 為 HTTP 日期字串，Decimal 與 timedelta 為 str()。
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID, timedelta)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def _orjson_option(self, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # orjson 只支援預設參數；帶其他參數 (如 indent) 時交給標準函式庫
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._orjson_option()).decode()
+
+    def response_bytes(self, obj):
+        # response() 送出的內容；conditional.json_with_etag 以它計算 ETag，不必再序列化一次
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None:
+            kwargs = {"indent": 2} if indent else {"separators": (",", ":")}
+            return (super().dumps(obj, **kwargs) + "\n").encode()
+        return orjson.dumps(obj, default=_default, option=self._orjson_option(indent)) + b"\n"
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.response_bytes(obj), mimetype=self.mimetype)
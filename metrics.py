@@ -0,0 +1,148 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from flask import Response, request
+import database
+
+# 每個 (route, method, status) 的延遲直方圖、近期樣本分位數 (p50/p95/p99)、
+# DB 往返次數與 cursor 內耗時，以 Prometheus 文字格式輸出於 /metrics
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_WINDOW = 1024  # 分位數以每個路由最近的 N 筆樣本計算
+
+_lock = threading.Lock()
+_series = {}
+# 目前請求累計的 [DB 往返次數, cursor 內秒數]；請求以外 (如啟動時) 為 None
+_current_db = ContextVar('current_db', default=None)
+_started_at = ContextVar('request_started_at', default=None)
+
+class _Series:
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.db_round_trips = 0
+        self.db_seconds = 0.0
+
+def _on_query(kind, sql, seconds):
+    stats = _current_db.get()
+    if stats is None:
+        return
+    if kind == 'execute':
+        stats[0] += 1
+    stats[1] += seconds
+
+def _before_request():
+    _started_at.set(time.perf_counter())
+    _current_db.set([0, 0.0])
+
+def _after_request(response, req=None):
+    # req 為 None 時使用 Flask 的 request；asgi.py 的 Quart app 傳入自己的 request
+    req = request if req is None else req
+    start = _started_at.get()
+    db = _current_db.get()
+    _started_at.set(None)
+    _current_db.set(None)
+    if start is None or db is None:
+        return response
+
+    elapsed = time.perf_counter() - start
+    route = req.url_rule.rule if req.url_rule else 'unmatched'
+    key = (route, req.method, str(response.status_code))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        idx = bisect.bisect_left(BUCKETS, elapsed)
+        if idx < len(BUCKETS):
+            series.bucket_counts[idx] += 1
+        series.count += 1
+        series.total += elapsed
+        series.samples.append(elapsed)
+        series.db_round_trips += db[0]
+        series.db_seconds += db[1]
+    return response
+
+def _labels(route, method, status, **extra):
+    items = [('route', route), ('method', method), ('status', status)] + list(extra.items())
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in items) + '}'
+
+def _quantile(sorted_samples, q):
+    idx = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return sorted_samples[idx]
+
+def render_metrics():
+    with _lock:
+        snapshot = [
+            (key, list(s.bucket_counts), s.count, s.total, sorted(s.samples), s.db_round_trips, s.db_seconds)
+            for key, s in _series.items()
+        ]
+
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by route and status.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (route, method, status), buckets, count, total, _, _, _ in snapshot:
+        cumulative = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'http_request_duration_seconds_bucket{_labels(route, method, status, le=bound)} {cumulative}')
+        lines.append(f'http_request_duration_seconds_bucket{_labels(route, method, status, le="+Inf")} {count}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(route, method, status)} {total}')
+        lines.append(f'http_request_duration_seconds_count{_labels(route, method, status)} {count}')
+
+    lines += [
+        f'# HELP http_request_latency_seconds Request latency quantiles over the last {SAMPLE_WINDOW} requests.',
+        '# TYPE http_request_latency_seconds summary',
+    ]
+    for (route, method, status), _, count, total, samples, _, _ in snapshot:
+        for q in QUANTILES:
+            lines.append(f'http_request_latency_seconds{_labels(route, method, status, quantile=q)} {_quantile(samples, q)}')
+        lines.append(f'http_request_latency_seconds_sum{_labels(route, method, status)} {total}')
+        lines.append(f'http_request_latency_seconds_count{_labels(route, method, status)} {count}')
+
+    lines += [
+        '# HELP db_round_trips_total Statements executed on DB cursors, by route.',
+        '# TYPE db_round_trips_total counter',
+    ]
+    for (route, method, status), _, _, _, _, round_trips, _ in snapshot:
+        lines.append(f'db_round_trips_total{_labels(route, method, status)} {round_trips}')
+
+    lines += [
+        '# HELP db_cursor_seconds_total Time spent inside DB cursor execute/fetch calls, by route.',
+        '# TYPE db_cursor_seconds_total counter',
+    ]
+    for (route, method, status), _, _, _, _, _, db_seconds in snapshot:
+        lines.append(f'db_cursor_seconds_total{_labels(route, method, status)} {db_seconds}')
+
+    return '\n'.join(lines) + '\n'
+
+def init_metrics(app):
+    if _on_query not in database.query_listeners:
+        database.query_listeners.append(_on_query)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def init_async_metrics(app, req):
+    # asgi.py 的 Quart app：記錄到同一份統計，/metrics 仍由 Flask app 輸出。
+    # hook 必須是 coroutine：Quart 會把同步函式丟到執行緒執行，設定的 ContextVar 不會留下
+    if _on_query not in database.query_listeners:
+        database.query_listeners.append(_on_query)
+
+    @app.before_request
+    async def _async_before_request():
+        _before_request()
+
+    @app.after_request
+    async def _async_after_request(response):
+        return _after_request(response, req)
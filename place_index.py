@@ -0,0 +1,153 @@
+import bisect
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict
+from config import Config
+from database import get_db_connection
+
+# 景點名稱 n-gram 倒排索引：
+# 以「單字 + 相鄰兩字」為 key，中文逐字切分、英文不分大小寫，
+# 查詢時取各 bigram 的交集再比對子字串，語意與 LIKE '%q%' 相同。
+# 另外維護依正規化名稱排序的陣列，供前綴自動完成以二分搜尋取得範圍。
+
+def _normalize(text):
+    return (text or '').casefold()
+
+def _grams(text):
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+class PlaceNameIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # 同時只讓一個執行緒重建
+        self._names = {}       # place_id -> 原始名稱
+        self._normalized = {}  # place_id -> 正規化名稱
+        self._postings = defaultdict(set)
+        self._sorted = []      # [(正規化名稱, place_id)]，依名稱排序
+        self._loaded_at = None
+        # 每次內容異動就換新的版本號 (含行程代號，不同 worker 不會撞號)，供 ETag 使用
+        self._generations = itertools.count(1)
+        self.version = f"{os.urandom(4).hex()}.0"
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _touch_locked(self):
+        self.version = f"{self.version.split('.')[0]}.{next(self._generations)}"
+
+    def _add_locked(self, place_id, name, keep_sorted=True):
+        self._names[place_id] = name
+        norm = _normalize(name)
+        self._normalized[place_id] = norm
+        for gram in _grams(norm):
+            self._postings[gram].add(place_id)
+        if keep_sorted:
+            bisect.insort(self._sorted, (norm, place_id))
+
+    def _remove_locked(self, place_id):
+        norm = self._normalized.pop(place_id, None)
+        self._names.pop(place_id, None)
+        if norm is None:
+            return
+        idx = bisect.bisect_left(self._sorted, (norm, place_id))
+        if idx < len(self._sorted) and self._sorted[idx] == (norm, place_id):
+            del self._sorted[idx]
+        for gram in _grams(norm):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(place_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def build(self, rows):
+        # rows: 可迭代的 (place_id, name)
+        with self._lock:
+            self._names.clear()
+            self._normalized.clear()
+            self._postings.clear()
+            for place_id, name in rows:
+                self._add_locked(place_id, name, keep_sorted=False)
+            self._sorted = sorted((norm, pid) for pid, norm in self._normalized.items())
+            self._loaded_at = time.monotonic()
+            self._touch_locked()
+
+    def load_from_db(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, name FROM places")
+            self.build(cursor.fetchall())
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _stale(self):
+        refresh = Config.PLACE_INDEX_REFRESH_SECONDS
+        return not self.loaded or bool(refresh and time.monotonic() - self._loaded_at > refresh)
+
+    def ensure_fresh(self):
+        # 多個 worker 各自持有索引，定期重建以吸收其他行程的異動。
+        # 過期時只由一個執行緒重建，其他請求繼續使用目前的索引；還沒載入過才需要等待
+        if not self._stale():
+            return
+        if not self._refresh_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if self._stale():
+                self.load_from_db()
+        finally:
+            self._refresh_lock.release()
+
+    def add(self, place_id, name):
+        with self._lock:
+            self._remove_locked(place_id)
+            self._add_locked(place_id, name)
+            self._touch_locked()
+
+    def remove(self, place_id):
+        with self._lock:
+            self._remove_locked(place_id)
+            self._touch_locked()
+
+    def get_name(self, place_id):
+        return self._names.get(place_id)
+
+    def prefix_ids(self, prefix, max_count=None):
+        # 名稱以 prefix 開頭的 place_id；超過 max_count 筆時回傳 None，由呼叫端改用快取
+        norm = _normalize(prefix)
+        with self._lock:
+            lo = bisect.bisect_left(self._sorted, (norm,))
+            hi = bisect.bisect_left(self._sorted, (norm + '\U0010ffff',))
+            if max_count is not None and hi - lo > max_count:
+                return None
+            return [pid for _, pid in self._sorted[lo:hi]]
+
+    def search(self, q, limit):
+        norm = _normalize(q)
+        if not norm:
+            return []
+        keys = [norm] if len(norm) <= 2 else [norm[i:i + 2] for i in range(len(norm) - 1)]
+
+        with self._lock:
+            postings = [self._postings.get(k) for k in keys]
+            if not all(postings):
+                return []
+            # 從最短的 posting 開始取交集，再驗證子字串
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            # 依正規化 (不分大小寫) 名稱排序，與 SQL 路徑在資料表定序下的 ORDER BY name 一致
+            matches = [
+                (self._normalized[pid], self._names[pid], pid) for pid in candidates
+                if norm in self._normalized[pid]
+            ]
+
+        top = heapq.nsmallest(limit, matches)
+        return [{"place_id": pid, "name": name} for _, name, pid in top]
+
+place_index = PlaceNameIndex()
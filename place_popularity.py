@@ -0,0 +1,207 @@
+import bisect
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from config import Config
+from database import get_db_connection
+from place_index import place_index
+
+# 景點熱門度：收藏數與評分 (總分、則數) 常駐記憶體，
+# 由收藏切換、評論新增/改寫/刪除即時增減，並定期與資料表重新對齊。
+#
+# 熱門度 = 收藏數 + REVIEW_WEIGHT * 貝氏平均分 * log(1 + 評論數)
+# 貝氏平均分把評論少的景點往 PRIOR_MEAN 拉，避免一則 5 分就排到最前面。
+PRIOR_MEAN = 3.0
+PRIOR_COUNT = 5
+REVIEW_WEIGHT = 2.0
+
+# 排行榜：依平均分 (至少 LEADERBOARD_MIN_REVIEWS 則評論) 與依收藏數，
+# 以排序好的 list 常駐記憶體，每次異動只搬動該景點的一個 key (bisect)，
+# 完整重算隨 load_from_db 定期與資料表對齊。
+LEADERBOARD_KINDS = ('score', 'favorites')
+
+class PlacePopularity:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # 同時只讓一個執行緒重新載入
+        self._favorites = defaultdict(int)    # place_id -> 收藏數
+        self._score_sum = defaultdict(float)  # place_id -> 評分總和
+        self._review_count = defaultdict(int)  # place_id -> 評論數
+        self._loaded_at = None
+        self.version = 0  # 任何異動 +1，前綴 top-k 快取依此判斷是否過期
+        # 排行榜：由小到大排序的 key，key 取負值讓最高的排在最前面
+        self._ranked = {kind: [] for kind in LEADERBOARD_KINDS}
+        self._rank_keys = {kind: {} for kind in LEADERBOARD_KINDS}  # place_id -> 目前在 list 中的 key
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def load_from_db(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT Places_id, COUNT(*) FROM favorites GROUP BY Places_id")
+            favorites = cursor.fetchall()
+            cursor.execute("SELECT Places_id, score_sum, review_count FROM place_review_stats")
+            reviews = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            self._favorites = defaultdict(int, {pid: cnt for pid, cnt in favorites})
+            self._score_sum = defaultdict(float, {pid: float(s) for pid, s, _ in reviews})
+            self._review_count = defaultdict(int, {pid: cnt for pid, _, cnt in reviews})
+            self._rebuild_rankings_locked()
+            self._loaded_at = time.monotonic()
+            self.version += 1
+
+    def _stale(self):
+        refresh = Config.PLACE_INDEX_REFRESH_SECONDS
+        return not self.loaded or bool(refresh and time.monotonic() - self._loaded_at > refresh)
+
+    def ensure_fresh(self):
+        # 與 place_index.ensure_fresh 相同：過期時只由一個執行緒重新載入，其他請求沿用目前的資料
+        if not self._stale():
+            return
+        if not self._refresh_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if self._stale():
+                self.load_from_db()
+        finally:
+            self._refresh_lock.release()
+
+    def apply_favorite(self, place_id, delta):
+        with self._lock:
+            self._favorites[place_id] += delta
+            self._rerank_locked(place_id)
+            self.version += 1
+
+    def apply_review(self, place_id, old_score, new_score):
+        # old_score 為 None 代表新增評論，new_score 為 None 代表刪除評論
+        with self._lock:
+            self._score_sum[place_id] += float(new_score or 0) - float(old_score or 0)
+            self._review_count[place_id] += (new_score is not None) - (old_score is not None)
+            self._rerank_locked(place_id)
+            self.version += 1
+
+    def remove(self, place_id):
+        with self._lock:
+            self._favorites.pop(place_id, None)
+            self._score_sum.pop(place_id, None)
+            self._review_count.pop(place_id, None)
+            self._rerank_locked(place_id)
+            self.version += 1
+
+    # --- 排行榜 ---
+    def _rank_key(self, kind, place_id):
+        # 回傳 None 代表不列入該排行榜
+        if kind == 'favorites':
+            favorites = self._favorites.get(place_id, 0)
+            return (-favorites, place_id) if favorites > 0 else None
+        count = self._review_count.get(place_id, 0)
+        if count < Config.LEADERBOARD_MIN_REVIEWS:
+            return None
+        # 平均分相同時評論多的在前
+        return (-round(self._score_sum.get(place_id, 0.0) / count, 6), -count, place_id)
+
+    def _rebuild_rankings_locked(self):
+        place_ids = set(self._favorites) | set(self._review_count)
+        for kind in LEADERBOARD_KINDS:
+            keys = {}
+            for pid in place_ids:
+                key = self._rank_key(kind, pid)
+                if key is not None:
+                    keys[pid] = key
+            self._rank_keys[kind] = keys
+            self._ranked[kind] = sorted(keys.values())
+
+    def _rerank_locked(self, place_id):
+        for kind in LEADERBOARD_KINDS:
+            ranked, keys = self._ranked[kind], self._rank_keys[kind]
+            old = keys.pop(place_id, None)
+            new = self._rank_key(kind, place_id)
+            if old == new:
+                if new is not None:
+                    keys[place_id] = new
+                continue
+            if old is not None:
+                i = bisect.bisect_left(ranked, old)
+                if i < len(ranked) and ranked[i] == old:
+                    ranked.pop(i)
+            if new is not None:
+                bisect.insort(ranked, new)
+                keys[place_id] = new
+
+    def leaderboard(self, kind, k):
+        # 回傳前 k 名的 place_id，已刪除 (索引中查不到名稱) 的景點略過
+        with self._lock:
+            ranked = self._ranked[kind]
+            result = []
+            for key in ranked:
+                place_id = key[-1]
+                if place_index.get_name(place_id) is not None:
+                    result.append(place_id)
+                    if len(result) >= k:
+                        break
+            return result
+
+    def stats(self, place_id):
+        count = self._review_count.get(place_id, 0)
+        return {
+            "favorite_count": self._favorites.get(place_id, 0),
+            "average_score": round(self._score_sum.get(place_id, 0.0) / count, 1) if count else 0.0,
+            "total_reviews": count,
+        }
+
+    def score(self, place_id):
+        count = self._review_count.get(place_id, 0)
+        bayes = (self._score_sum.get(place_id, 0.0) + PRIOR_MEAN * PRIOR_COUNT) / (count + PRIOR_COUNT)
+        return self._favorites.get(place_id, 0) + REVIEW_WEIGHT * bayes * math.log1p(count)
+
+    def top(self, place_ids, k):
+        return heapq.nlargest(k, place_ids, key=lambda pid: (self.score(pid), -pid))
+
+place_popularity = PlacePopularity()
+
+# --- 前綴自動完成 ---
+# 範圍不大時直接在範圍內取 top-k；範圍很大 (短前綴) 時使用快取的 top-k：
+# 索引有異動 (景點增刪) 立即重算；熱門度每次收藏 / 評論都會變，
+# 只在快取超過 AUTOCOMPLETE_STALE_SECONDS 秒後才重算，排名最多落後這麼久。
+AUTOCOMPLETE_MAX_K = 20
+AUTOCOMPLETE_SCAN_LIMIT = 256
+AUTOCOMPLETE_STALE_SECONDS = 5
+_prefix_cache = {}  # 正規化前綴 -> (索引版本, 熱門度版本, 計算時間, [place_id])
+_prefix_cache_lock = threading.Lock()
+
+def autocomplete(prefix, limit):
+    limit = min(limit, AUTOCOMPLETE_MAX_K)
+    ids = place_index.prefix_ids(prefix, max_count=AUTOCOMPLETE_SCAN_LIMIT)
+    if ids is not None:
+        top = place_popularity.top(ids, limit)
+    else:
+        key = prefix.casefold()
+        index_version, popularity_version = place_index.version, place_popularity.version
+        now = time.monotonic()
+        cached = _prefix_cache.get(key)
+        if cached and cached[0] == index_version and (
+                cached[1] == popularity_version or now - cached[2] < AUTOCOMPLETE_STALE_SECONDS):
+            top = cached[3][:limit]
+        else:
+            full = place_popularity.top(place_index.prefix_ids(prefix), AUTOCOMPLETE_MAX_K)
+            with _prefix_cache_lock:
+                if len(_prefix_cache) > 10000:
+                    _prefix_cache.clear()
+                _prefix_cache[key] = (index_version, popularity_version, now, full)
+            top = full[:limit]
+
+    results = []
+    for pid in top:
+        name = place_index.get_name(pid)
+        if name is not None:
+            results.append({"place_id": pid, "name": name, **place_popularity.stats(pid)})
+    return results
@@ -0,0 +1,149 @@
+import threading
+import weakref
+from mysql.connector import errors
+from mysql.connector.connection import MySQLConnection
+from mysql.connector.cursor import MySQLCursorPreparedDict
+from config import Config
+from database import get_db_connection
+from user_counters import FAVORITES_VERSION_SQL
+
+# 熱門查詢以伺服器端 prepared statement 執行：每條實體連線第一次用到時 prepare，
+# 之後同一條連線重複使用同一個 statement，MySQL 不必每次重新解析 SQL。
+# 連線重新連上 (connection_id 改變) 或伺服器回報找不到 statement 時自動重新 prepare。
+# 連線需由 get_db_connection(statements=True) 借自專用連線池：該池歸還時不 reset session
+# (reset 會清掉所有 prepared statement)，只執行這裡的唯讀查詢，不會留下其他 session 狀態。
+# 溢出的臨時連線用完即關閉，prepare 只會多一個往返，改用一般文字查詢。
+
+HOT_QUERIES = {
+    # get_trip_events：行程內所有活動與帳目
+    "trip_events": """
+        SELECT 
+            e.id, e.Trips_id, e.day_no, e.title, 
+            e.start_time, e.end_time, e.place_name, 
+            ex.category, ex.amount AS expense 
+        FROM events e
+        LEFT JOIN expenses ex ON e.id = ex.Events_id
+        WHERE e.Trips_id = %s
+        ORDER BY e.day_no ASC, e.start_time ASC
+    """,
+    # get_trip_events：各類別花費
+    "trip_category_sums": """
+        SELECT category, SUM(amount) AS total_amount
+        FROM expenses
+        WHERE Trips_id = %s
+        GROUP BY category
+    """,
+    # login：行程與收藏數由 user_counters 維護，不需再 COUNT
+    "user_login": """
+        SELECT 
+            u.id, u.name, u.email,
+            COALESCE(c.total_trips, 0) AS total_trips,
+            COALESCE(c.total_favorites, 0) AS total_favorites
+        FROM users u
+        LEFT JOIN user_counters c ON c.Users_id = u.id
+        WHERE u.email = %s AND u.password = %s
+    """,
+    # get_my_favorites：透過 favorites 表 JOIN places
+    "user_favorites": """
+        SELECT p.id AS place_id, p.name 
+        FROM favorites f
+        JOIN places p ON f.Places_id = p.id
+        WHERE f.Users_id = %s
+    """,
+    # get_my_favorites：收藏版本，與快取 / ETag 比對
+    "user_favorites_version": FAVORITES_VERSION_SQL,
+    # handle_private_review (GET)：個人評論與預先彙總的平均分數
+    "user_place_review": "SELECT score, comment FROM reviews WHERE Users_id = %s AND Places_id = %s",
+    "place_review_stat": "SELECT score_sum, review_count FROM place_review_stats WHERE Places_id = %s",
+}
+
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+class ReusedStatementCursor(MySQLCursorPreparedDict):
+    # mysql-connector 每次 execute 前都會送 COM_STMT_RESET (多一個往返)；reset 只在送過 long data
+    # 或伺服器端 cursor 尚未關閉時才需要，這裡的參數都很短、每次都 fetchall 讀完，
+    # 重複執行同一個 statement 時直接送 COM_STMT_EXECUTE
+    def execute(self, operation, params=None, map_results=False):
+        if operation is not self._executed or not self._prepared or map_results:
+            return super().execute(operation, params, map_results)
+        params = tuple(params or ())
+        if len(self._prepared["parameters"]) != len(params):
+            raise errors.ProgrammingError(errno=1210, msg="Incorrect number of arguments executing prepared statement")
+        self._handle_result(self._connection.cmd_stmt_execute(
+            self._prepared["statement_id"], data=params, parameters=self._prepared["parameters"]))
+
+_lock = threading.Lock()
+_by_connection = weakref.WeakKeyDictionary()  # 實體連線 -> (connection_id, {名稱: cursor})
+
+def enabled():
+    # 不使用連線池時每次都是新連線，prepare 沒有好處
+    return Config.PREPARED_STATEMENTS_ENABLED and Config.DB_POOL_ENABLED
+
+def _physical(conn):
+    # ConnectionProxy -> PooledMySQLConnection -> 實體連線 (歸還後再借出仍是同一條)
+    raw = getattr(conn, '_conn', conn)
+    return getattr(raw, '_cnx', raw)
+
+def _forget(conn):
+    with _lock:
+        _by_connection.pop(_physical(conn), None)
+
+def _cursor(conn, name):
+    physical = _physical(conn)
+    connection_id = physical.connection_id
+    with _lock:
+        entry = _by_connection.get(physical)
+        if entry is None or entry[0] != connection_id:
+            # 第一次使用或已重連：舊的 statement 在伺服器端已不存在，直接丟棄
+            entry = _by_connection[physical] = (connection_id, {})
+    cursors = entry[1]
+    cursor = cursors.get(name)
+    if cursor is None:
+        if isinstance(physical, MySQLConnection):
+            cursor = conn.cursor(cursor_class=ReusedStatementCursor)
+        else:
+            # C 擴充版連線沒有純 Python 的 prepared cursor，照常使用 (每次 execute 前仍會 reset)
+            cursor = conn.cursor(prepared=True, dictionary=True)
+        cursors[name] = cursor
+    return cursor
+
+def fetch_all(conn, name, params=()):
+    sql = HOT_QUERIES[name]
+    if not enabled() or conn.is_overflow:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    for attempt in range(2):
+        cursor = _cursor(conn, name)
+        try:
+            # 同一個 sql 物件再次執行時 cursor 會沿用已 prepare 的 statement
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        except errors.DatabaseError as e:
+            if attempt or e.errno != ER_UNKNOWN_STMT_HANDLER:
+                raise
+            _forget(conn)
+
+def fetch_one(conn, name, params=()):
+    rows = fetch_all(conn, name, params)
+    return rows[0] if rows else None
+
+def warm_statements():
+    # 啟動預熱：一次借出所有常駐連線，逐條 prepare 全部熱門查詢
+    # (以 NULL 參數執行一次，不會命中任何資料列)
+    if not enabled():
+        return
+    conns = []
+    try:
+        for _ in range(Config.DB_STMT_POOL_SIZE):
+            conns.append(get_db_connection(readonly=False, statements=True))
+        for conn in conns:
+            for name, sql in HOT_QUERIES.items():
+                fetch_all(conn, name, (None,) * sql.count('%s'))
+    finally:
+        for conn in conns:
+            conn.close()
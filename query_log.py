@@ -0,0 +1,151 @@
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+from config import Config
+import database
+
+# 每個請求的 SQL 統計：執行次數、各 SQL 樣板的次數；
+# 單次 execute / fetch 超過 SLOW_QUERY_MS 寫入慢查詢記錄 (附正規化後的 SQL 與路由)，
+# 同一個樣板在一次請求內執行超過 N_PLUS_ONE_THRESHOLD 次 (次數隨結果筆數成長) 標記為 N+1；
+# INSERT / REPLACE 與 chunked() 內的分批迴圈本來就會重複同一組 SQL，不列入 N+1 判斷。
+# DB_DEBUG_HEADERS 開啟 (或 debug 模式) 時回應帶上 X-DB-Query-Count 等 header。
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SPACE = re.compile(r"\s+")
+
+def normalize_sql(sql):
+    # 常數與參數換成 ?，IN (?, ?, ...) 與多列 VALUES 收成一組，空白壓成一格
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _STRING.sub('?', sql or '')
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUES_LIST.sub(r'\1, ...', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+class _RequestQueries:
+    def __init__(self, route):
+        self.route = route
+        self.count = 0
+        self.slow = 0
+        self.templates = Counter()
+
+    def n_plus_one(self):
+        # 回傳 [(樣板, 次數)]，依次數由多到少
+        return [(t, n) for t, n in self.templates.most_common() if n > Config.N_PLUS_ONE_THRESHOLD]
+
+_current = ContextVar('current_queries', default=None)
+_chunked = ContextVar('chunked_queries', default=False)
+_logger = None
+_lock = threading.Lock()
+_routes = {}  # route -> 累計統計
+
+def _on_query(kind, sql, seconds):
+    current = _current.get()
+    if kind == 'execute' and current is not None:
+        current.count += 1
+        if not _chunked.get():
+            template = normalize_sql(sql)
+            if not template[:7].upper().startswith(('INSERT', 'REPLACE')):
+                current.templates[template] += 1
+    if seconds * 1000 >= Config.SLOW_QUERY_MS:
+        if current is not None:
+            current.slow += 1
+        if _logger is not None:
+            _logger.warning(
+                f"慢查詢 {seconds * 1000:.1f}ms ({kind}) route={current.route if current else '-'} "
+                f"sql={normalize_sql(sql)}"
+            )
+
+def _before_request(req=None):
+    # req 為 None 時使用 Flask 的 request；asgi.py 的 Quart app 傳入自己的 request
+    req = request if req is None else req
+    route = req.url_rule.rule if req.url_rule else 'unmatched'
+    _current.set(_RequestQueries(f"{req.method} {route}"))
+
+def _after_request_factory(app):
+    def _after_request(response):
+        current = _current.get()
+        _current.set(None)
+        if current is None:
+            return response
+
+        suspects = current.n_plus_one()
+        with _lock:
+            stats = _routes.get(current.route)
+            if stats is None:
+                stats = _routes[current.route] = {
+                    "requests": 0, "statements": 0, "max_statements": 0,
+                    "slow_statements": 0, "n_plus_one_requests": 0, "n_plus_one_sql": None,
+                }
+            stats["requests"] += 1
+            stats["statements"] += current.count
+            stats["max_statements"] = max(stats["max_statements"], current.count)
+            stats["slow_statements"] += current.slow
+            if suspects:
+                stats["n_plus_one_requests"] += 1
+                stats["n_plus_one_sql"] = suspects[0][0]
+            route_avg = stats["statements"] / stats["requests"]
+
+        if suspects:
+            template, times = suspects[0]
+            app.logger.warning(f"疑似 N+1 route={current.route} 同一 SQL 執行 {times} 次：{template}")
+
+        if Config.DB_DEBUG_HEADERS or app.debug:
+            response.headers['X-DB-Query-Count'] = str(current.count)
+            response.headers['X-DB-Route-Query-Avg'] = f"{route_avg:.1f}"
+            if suspects:
+                response.headers['X-DB-N-Plus-One'] = f"{suspects[0][1]}x {suspects[0][0][:200]}"
+        return response
+    return _after_request
+
+@contextmanager
+def chunked():
+    # 分批寫入 / 匯入的迴圈：每批重複同一組 SQL 是刻意的，仍計入執行次數，但不判定為 N+1
+    token = _chunked.set(True)
+    try:
+        yield
+    finally:
+        _chunked.reset(token)
+
+def get_query_stats():
+    with _lock:
+        routes = {route: dict(stats) for route, stats in _routes.items()}
+    for stats in routes.values():
+        stats["avg_statements"] = round(stats["statements"] / stats["requests"], 2)
+    return {
+        "slow_query_ms": Config.SLOW_QUERY_MS,
+        "n_plus_one_threshold": Config.N_PLUS_ONE_THRESHOLD,
+        "routes": routes,
+    }
+
+def init_query_log(app):
+    global _logger
+    _logger = app.logger
+    if _on_query not in database.query_listeners:
+        database.query_listeners.append(_on_query)
+    app.before_request(_before_request)
+    app.after_request(_after_request_factory(app))
+
+def init_async_query_log(app, req):
+    # asgi.py 的 Quart app：統計併入同一份 /api/admin/query-stats；
+    # hook 必須是 coroutine (見 metrics.init_async_metrics)
+    if _on_query not in database.query_listeners:
+        database.query_listeners.append(_on_query)
+    after_request = _after_request_factory(app)
+
+    @app.before_request
+    async def _async_before_request():
+        _before_request(req)
+
+    @app.after_request
+    async def _async_after_request(response):
+        return after_request(response)
@@ -0,0 +1,95 @@
+import sys
+from database import get_db_connection
+import prepared_statements
+
+# 每個景點的評分彙總 (總分、則數)，由評論的新增/改寫/刪除以 O(1) 增量維護，
+# 讀取平均分時不必再對 reviews 做 AVG/COUNT。
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS place_review_stats (
+        Places_id INT NOT NULL PRIMARY KEY,
+        score_sum DECIMAL(20, 2) NOT NULL DEFAULT 0,
+        review_count INT NOT NULL DEFAULT 0,
+        FOREIGN KEY (Places_id) REFERENCES places(id) ON DELETE CASCADE
+    )
+"""
+
+def ensure_table(cursor):
+    # 回傳 True 代表資料表是這次才建立，需要先 rebuild 一次
+    cursor.execute("SHOW TABLES LIKE 'place_review_stats'")
+    exists = cursor.fetchone() is not None
+    if not exists:
+        cursor.execute(CREATE_TABLE_SQL)
+    return not exists
+
+def apply_review_change(cursor, place_id, old_score, new_score):
+    # old_score 為 None 代表新增評論，new_score 為 None 代表刪除評論
+    if old_score is None and new_score is None:
+        return
+    delta_sum = float(new_score or 0) - float(old_score or 0)
+    delta_count = (new_score is not None) - (old_score is not None)
+    cursor.execute("""
+        INSERT INTO place_review_stats (Places_id, score_sum, review_count)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            score_sum = score_sum + VALUES(score_sum),
+            review_count = review_count + VALUES(review_count)
+    """, (place_id, delta_sum, delta_count))
+
+def get_place_stat(conn, place_id):
+    return place_stat_body(prepared_statements.fetch_one(conn, "place_review_stat", (place_id,)))
+
+def place_stat_body(row):
+    # place_review_stat 查詢結果 -> 回傳格式 (async_routes 共用)
+    if not row:
+        return {"average_score": 0.0, "total_reviews": 0}
+    score_sum, count = row['score_sum'], row['review_count']
+    return {
+        "average_score": round(float(score_sum) / count, 1) if count else 0.0,
+        "total_reviews": count
+    }
+
+def rebuild(conn):
+    # 從 reviews 一次重算所有彙總，修正任何偏差
+    cursor = conn.cursor()
+    try:
+        ensure_table(cursor)
+        cursor.execute("DELETE FROM place_review_stats")
+        cursor.execute("""
+            INSERT INTO place_review_stats (Places_id, score_sum, review_count)
+            SELECT Places_id, SUM(score), COUNT(id)
+            FROM reviews
+            GROUP BY Places_id
+        """)
+        rebuilt = cursor.rowcount
+        conn.commit()
+        return rebuilt
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def init_review_stats():
+    conn = get_db_connection(readonly=False)  # 建表與重算一律在主庫 (/readyz 重試預熱時身處 GET 請求)
+    cursor = conn.cursor()
+    try:
+        created = ensure_table(cursor)
+    finally:
+        cursor.close()
+    try:
+        if created:
+            rebuild(conn)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    # 用法：python review_stats.py rebuild
+    if sys.argv[1:] != ['rebuild']:
+        print("用法：python review_stats.py rebuild")
+        sys.exit(1)
+    conn = get_db_connection(readonly=False)
+    try:
+        print(f"已重算 {rebuild(conn)} 個景點的評分彙總")
+    finally:
+        conn.close()
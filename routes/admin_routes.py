@@ -1,9 +1,239 @@
-from flask import Blueprint, request, jsonify
-from database import get_db_connection
+import re
+import threading
+import time
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from database import get_db_connection, get_pool_stats
+from config import Config
+from cache import get_cache_stats
+from query_log import get_query_stats
+import review_stats
+import user_counters
+import expense_rollups
 
 # 建立 Blueprint
 admin_bp = Blueprint('admin_bp', __name__)
 
+QUERY_KEYWORDS = ["SELECT", "WITH", "SHOW", "DESC", "DESCRIBE", "EXPLAIN"]
+# 可以先跑 EXPLAIN 估算成本的指令
+EXPLAIN_KEYWORDS = ["SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE"]
+# 會回傳結果集、受 sql_select_limit 限制的查詢
+SELECT_KEYWORDS = ["SELECT", "WITH"]
+
+# 開頭的空白、註解 (/* */、-- 、#) 與左括號；/*! */ 是會被執行的版本註解，不略過
+_LEADING_NOISE = re.compile(r"(?:\s+|\(|/\*(?!!).*?\*/|--(?:\s[^\n]*)?(?:\n|$)|#[^\n]*(?:\n|$))", re.S)
+
+# 防護模式下同時執行的 raw-sql 數量上限，避免後台查詢佔滿連線池
+_raw_sql_slots = threading.BoundedSemaphore(Config.RAW_SQL_MAX_CONCURRENT)
+
+def statement_keyword(raw_query):
+    # 略過開頭的註解與括號後取第一個字 (大寫)，認不出來時回傳空字串
+    pos = 0
+    while True:
+        match = _LEADING_NOISE.match(raw_query, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+    word = re.match(r"[A-Za-z]+", raw_query[pos:])
+    return word.group(0).upper() if word else ""
+
+def is_query(raw_query):
+    # 判斷指令類型，以符合前端的 type 判斷邏輯
+    return statement_keyword(raw_query) in QUERY_KEYWORDS
+
+def is_select(raw_query):
+    return statement_keyword(raw_query) in SELECT_KEYWORDS
+
+# --- raw-sql 防護 ---
+def explain_guard(cursor, raw_query):
+    # 回傳 (超過門檻的全表掃描, 其他警告)，每項為一段說明文字
+    if statement_keyword(raw_query) not in EXPLAIN_KEYWORDS:
+        return [], []
+    cursor.execute("EXPLAIN " + raw_query)
+    blocked, warnings = [], []
+    for row in cursor.fetchall():
+        if row.get('type') != 'ALL':
+            continue
+        estimate = int(row.get('rows') or 0)
+        message = f"資料表 {row.get('table')} 全表掃描，預估 {estimate} 列"
+        (blocked if estimate > Config.RAW_SQL_MAX_SCAN_ROWS else warnings).append(message)
+    return blocked, warnings
+
+def handler_reads(cursor):
+    # Handler_read_* 累計值，前後相減即為這條連線上讀取的列數 (近似 rows examined)
+    cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    return sum(int(row['Value']) for row in cursor.fetchall())
+
+def apply_session_limits(cursor, select_limit):
+    # max_execution_time 只作用於 SELECT；未寫 LIMIT 的 SELECT 最多回傳 select_limit 筆
+    cursor.execute("SET SESSION max_execution_time = %s", (Config.RAW_SQL_TIMEOUT_MS,))
+    cursor.execute("SET SESSION sql_select_limit = %s", (select_limit,))
+
+def reset_session_limits(cursor):
+    cursor.execute("SET SESSION max_execution_time = DEFAULT, sql_select_limit = DEFAULT")
+
+def start_watchdog(conn, raw_query):
+    # max_execution_time 只中斷 SELECT，其他指令 (UPDATE / DELETE / ALTER / WITH ... UPDATE 等)
+    # 超過 RAW_SQL_TIMEOUT_MS 由另一條主庫連線送 KILL QUERY 中斷。
+    # 回傳 stop()，指令結束後呼叫；回傳值表示是否已逾時被中斷。
+    # stop() 與送出 KILL 共用同一把鎖，stop() 之後不會再誤殺這條連線上的下一個指令
+    if statement_keyword(raw_query) == "SELECT":
+        return lambda: False
+    thread_id = conn.connection_id
+    logger = current_app.logger
+    lock = threading.Lock()
+    state = {"running": True, "killed": False}
+
+    def kill():
+        with lock:
+            if not state["running"]:
+                return
+            killer = None
+            try:
+                killer = get_db_connection(readonly=False)
+                cursor = killer.cursor()
+                cursor.execute(f"KILL QUERY {int(thread_id)}")
+                cursor.close()
+                state["killed"] = True
+                logger.warning(f"raw-sql timeout {Config.RAW_SQL_TIMEOUT_MS}ms, killed query={raw_query!r}")
+            except Exception as e:
+                logger.warning(f"raw-sql watchdog failed {e} query={raw_query!r}")
+            finally:
+                if killer:
+                    killer.close()
+
+    timer = threading.Timer(Config.RAW_SQL_TIMEOUT_MS / 1000, kill)
+    timer.daemon = True
+    timer.start()
+
+    def stop():
+        timer.cancel()
+        with lock:
+            state["running"] = False
+            return state["killed"]
+    return stop
+
+def log_query(raw_query, seconds, rows_examined, rows, outcome):
+    current_app.logger.info(
+        f"raw-sql {outcome} {seconds * 1000:.1f}ms rows_examined={rows_examined} rows={rows} query={raw_query!r}"
+    )
+
+def reject_query(raw_query, blocked):
+    current_app.logger.warning(f"raw-sql rejected {'; '.join(blocked)} query={raw_query!r}")
+    return jsonify({
+        "code": "400",
+        "message": f"查詢成本過高 (全表掃描超過 {Config.RAW_SQL_MAX_SCAN_ROWS} 列)，請加上條件或索引；確定要執行請帶 force",
+        "warnings": blocked
+    }), 400
+
+def stream_query(raw_query, max_rows, guarded=False, force=False):
+    # 串流模式：未緩衝 cursor 逐批讀取，以 NDJSON 逐行送出，記憶體用量與結果大小無關
+    # 第一行為表頭資訊，之後每行一筆資料，最後一行為統計
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    warnings = []
+    reads_before = None
+    stop_watchdog = lambda: False
+    try:
+        if guarded:
+            blocked, warnings = explain_guard(cursor, raw_query)
+            if blocked and not force:
+                cursor.close()
+                conn.close()
+                return reject_query(raw_query, blocked)
+            warnings = blocked + warnings
+            reads_before = handler_reads(cursor)
+            # 由伺服器端限制 SELECT 最多回傳 max_rows + 1 筆 (多一筆用來判斷是否截斷)
+            apply_session_limits(cursor, max_rows + 1)
+            stop_watchdog = start_watchdog(conn, raw_query)
+        else:
+            cursor.execute("SET SESSION sql_select_limit = %s", (max_rows + 1,))
+        start = time.perf_counter()
+        cursor.execute(raw_query)
+        if not cursor.with_rows:
+            # 開頭像查詢、實際沒有結果集 (如 WITH ... UPDATE)：照一般修改指令處理
+            stop_watchdog()
+            conn.commit()
+            if guarded:
+                log_query(raw_query, time.perf_counter() - start,
+                          handler_reads(cursor) - reads_before, cursor.rowcount, "ok")
+                reset_session_limits(cursor)
+            else:
+                cursor.execute("SET SESSION sql_select_limit = DEFAULT")
+            cursor.close()
+            conn.close()
+            return jsonify({
+                "code": "200",
+                "type": "update",
+                "message": f"指令執行成功，影響列數: {cursor.rowcount}",
+                "data": [],
+                "warnings": warnings
+            }), 200
+    except Exception as e:
+        killed = stop_watchdog()
+        # 執行失敗或被中斷時 session 設定可能沒還原，直接斷開連線
+        conn.discard()
+        message = f"SQL 執行超過 {Config.RAW_SQL_TIMEOUT_MS} 毫秒，已中斷" if killed else "SQL 執行失敗"
+        return jsonify({"code": "500", "message": message, "error": str(e)}), 500
+
+    logger = current_app.logger
+    state = {"finished": False}
+
+    def generate():
+        dumps = current_app.json.dumps
+        sent = 0
+        truncated = False
+        try:
+            header = {"code": "200", "type": "query", "columns": list(cursor.column_names)}
+            if warnings:
+                header["warnings"] = warnings
+            yield dumps(header) + "\n"
+            while True:
+                rows = cursor.fetchmany(Config.RAW_SQL_STREAM_BATCH)
+                if not rows:
+                    break
+                for row in rows:
+                    if sent >= max_rows:
+                        truncated = True
+                        break
+                    yield dumps(row) + "\n"
+                    sent += 1
+            yield dumps({"done": True, "rows": sent, "truncated": truncated, "message": "查詢執行成功"}) + "\n"
+        except Exception as e:
+            if guarded:
+                log_query(raw_query, time.perf_counter() - start, None, sent, "failed")
+            yield dumps({"done": False, "rows": sent, "message": "SQL 執行失敗", "error": str(e)}) + "\n"
+            return
+
+        # 正常送完：剩餘結果最多一筆 (受 sql_select_limit 限制)，讀掉後還原 session 設定；
+        # 這裡失敗時交給 cleanup() 斷開連線
+        try:
+            if cursor.with_rows:
+                cursor.fetchall()
+            stop_watchdog()
+            if guarded:
+                log_query(raw_query, time.perf_counter() - start, handler_reads(cursor) - reads_before, sent, "ok")
+                reset_session_limits(cursor)
+            else:
+                cursor.execute("SET SESSION sql_select_limit = DEFAULT")
+            state["finished"] = True
+        except Exception:
+            pass
+
+    def cleanup():
+        # 由 response.close() 呼叫：回應沒被讀取 (如 HEAD)、用戶端中途斷線或串流出錯時
+        # 不讀完剩餘結果，直接斷開實體連線 (連同 session 設定一併丟棄)
+        stop_watchdog()
+        if state["finished"]:
+            cursor.close()
+            conn.close()
+        else:
+            logger.info(f"raw-sql aborted query={raw_query!r}")
+            conn.discard()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(cleanup)
+    return response
+
 @admin_bp.route('/admin/raw-sql', methods=['POST'])
 def execute_sql():
     data = request.json
@@ -11,45 +241,162 @@ def execute_sql():
     
     if not raw_query:
         return jsonify({"code": "400", "message": "請輸入 SQL 語法"}), 400
-        
+
+    stream = data.get('stream') and is_query(raw_query)
+    if stream:
+        try:
+            max_rows = int(data.get('max_rows') or Config.RAW_SQL_STREAM_MAX_ROWS)
+        except (TypeError, ValueError):
+            return jsonify({"code": "400", "message": "max_rows 必須是整數"}), 400
+        max_rows = max(1, min(max_rows, Config.RAW_SQL_STREAM_MAX_ROWS))
+
+    # 防護模式：先 EXPLAIN 擋下大範圍全表掃描、限制執行時間與回傳筆數，並記錄每條指令
+    guarded = Config.RAW_SQL_GUARD_ENABLED
+    force = bool(data.get('force'))
+    if guarded and not _raw_sql_slots.acquire(blocking=False):
+        return jsonify({"code": "429", "message": "其他 SQL 指令執行中，請稍後再試"}), 429
+    release = _raw_sql_slots.release if guarded else None
+
+    try:
+        # 串流模式只用於查詢類指令，修改類指令照舊回傳一般 JSON
+        if stream:
+            response = stream_query(raw_query, max_rows, guarded, force)
+            if release and isinstance(response, Response):
+                # 串流送完 (或連線中斷) 才釋放名額
+                response.call_on_close(release)
+                release = None
+            return response
+        return run_query(raw_query, guarded, force)
+    finally:
+        if release:
+            release()
+
+def run_query(raw_query, guarded, force):
     conn = get_db_connection()
     # 使用 dictionary=True 確保前端能拿到鍵值對來產生表頭
     cursor = conn.cursor(dictionary=True)
+    warnings = []
+    stop_watchdog = lambda: False
     
     try:
+        if guarded:
+            blocked, warnings = explain_guard(cursor, raw_query)
+            if blocked and not force:
+                return reject_query(raw_query, blocked)
+            warnings = blocked + warnings
+            reads_before = handler_reads(cursor)
+            # 多取一筆，用來判斷結果是否被自動上限截斷
+            apply_session_limits(cursor, Config.RAW_SQL_AUTO_LIMIT + 1)
+            stop_watchdog = start_watchdog(conn, raw_query)
+
+        start = time.perf_counter()
         cursor.execute(raw_query)
-        
-        # 轉大寫判斷指令類型，以符合前端的 type 判斷邏輯
-        query_upper = raw_query.strip().upper()
+        # 依實際有沒有結果集判斷，WITH 開頭也可能是 UPDATE / DELETE
+        result = cursor.fetchall() if cursor.with_rows else None
+        stop_watchdog()
         
         # 情況 A：查詢類指令 (SELECT, SHOW, DESC, EXPLAIN)
-        if any(query_upper.startswith(word) for word in ["SELECT", "SHOW", "DESC", "EXPLAIN"]):
-            result = cursor.fetchall()
-            return jsonify({
+        if result is not None:
+            body = {
                 "code": "200",
                 "type": "query",  # ★ 這是前端對應 table 顯示的關鍵
                 "data": result,
                 "message": "查詢執行成功"
-            }), 200
+            }
+            if guarded:
+                # 多出的那一筆代表被 sql_select_limit 截斷 (查詢自帶更大的 LIMIT 時不受影響)
+                truncated = is_select(raw_query) and len(result) == Config.RAW_SQL_AUTO_LIMIT + 1
+                if truncated:
+                    result = body["data"] = result[:Config.RAW_SQL_AUTO_LIMIT]
+                log_query(raw_query, time.perf_counter() - start,
+                          handler_reads(cursor) - reads_before, len(result), "ok")
+                body["truncated"] = truncated
+                body["warnings"] = warnings
+            return jsonify(body), 200
             
         # 情況 B：修改類指令 (INSERT, UPDATE, DELETE, ALTER, DROP)
         else:
             conn.commit()
+            if guarded:
+                log_query(raw_query, time.perf_counter() - start,
+                          handler_reads(cursor) - reads_before, cursor.rowcount, "ok")
             return jsonify({
                 "code": "200",
                 "type": "update", # ★ 這是前端顯示系統訊息的關鍵
                 "message": f"指令執行成功，影響列數: {cursor.rowcount}",
-                "data": []
+                "data": [],
+                "warnings": warnings
             }), 200
 
     except Exception as e:
+        killed = stop_watchdog()
         if conn:
             conn.rollback()
+        if guarded:
+            current_app.logger.warning(f"raw-sql failed {e} query={raw_query!r}")
         return jsonify({
             "code": "500", 
-            "message": "SQL 執行失敗", 
+            "message": f"SQL 執行超過 {Config.RAW_SQL_TIMEOUT_MS} 毫秒，已中斷" if killed else "SQL 執行失敗", 
             "error": str(e)
         }), 500
     finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        # 還原 session 設定失敗時不可蓋掉已經準備好的回應：記下錯誤並直接斷開連線
+        try:
+            if guarded:
+                reset_session_limits(cursor)
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            current_app.logger.warning(f"raw-sql reset failed {e} query={raw_query!r}")
+            conn.discard()
+
+# --- 連線池狀態 (使用中 / 閒置 / 等待時間) ---
+@admin_bp.route('/admin/db-pool', methods=['GET'])
+def db_pool_stats():
+    return jsonify({"code": "200", "data": get_pool_stats()}), 200
+
+# --- 各路由的 SQL 次數、慢查詢與疑似 N+1 ---
+@admin_bp.route('/admin/query-stats', methods=['GET'])
+def query_stats():
+    return jsonify({"code": "200", "data": get_query_stats()}), 200
+
+# --- 快取命中率 ---
+@admin_bp.route('/admin/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({"code": "200", "data": get_cache_stats()}), 200
+
+# --- 重算所有景點的評分彙總 ---
+@admin_bp.route('/admin/review-stats/rebuild', methods=['POST'])
+def rebuild_review_stats():
+    conn = get_db_connection()
+    try:
+        rebuilt = review_stats.rebuild(conn)
+        return jsonify({"code": "200", "message": f"已重算 {rebuilt} 個景點的評分彙總"}), 200
+    except Exception as e:
+        return jsonify({"code": "500", "message": "重算失敗", "error": str(e)}), 500
+    finally:
+        conn.close()
+
+# --- 校正使用者的行程數與收藏數 ---
+@admin_bp.route('/admin/user-counters/check', methods=['POST'])
+def check_user_counters():
+    conn = get_db_connection()
+    try:
+        fixed = user_counters.check_and_repair(conn)
+        return jsonify({"code": "200", "message": f"已修正 {fixed} 位使用者的計數"}), 200
+    except Exception as e:
+        return jsonify({"code": "500", "message": "校正失敗", "error": str(e)}), 500
+    finally:
+        conn.close()
+
+# --- 重算所有行程的每日 / 類別花費小計 ---
+@admin_bp.route('/admin/expense-rollups/rebuild', methods=['POST'])
+def rebuild_expense_rollups():
+    conn = get_db_connection()
+    try:
+        rebuilt = expense_rollups.rebuild(conn)
+        return jsonify({"code": "200", "message": f"已重算 {rebuilt} 筆花費小計"}), 200
+    except Exception as e:
+        return jsonify({"code": "500", "message": "重算失敗", "error": str(e)}), 500
+    finally:
+        conn.close()
@@ -0,0 +1,141 @@
+import asyncio
+from functools import partial
+from quart import Blueprint, request, jsonify, current_app
+from async_database import fetch_all, fetch_one
+from cache import trip_events_cache, user_favorites_cache
+import conditional
+from config import Config
+from place_index import place_index
+from prepared_statements import HOT_QUERIES
+from review_stats import place_stat_body
+from routes.user_routes import login_body
+from routes.trip_routes import parse_trip_list_args, trip_list_etag, trip_list_query, trip_list_body
+from routes.event_routes import trip_events_payload
+from routes.place_routes import (parse_place_search_args, place_index_etag, place_search_query,
+                                 place_list_body, private_review_body)
+from user_counters import TRIPS_VERSION_SQL, favorites_etag
+
+# 高流量讀取路由的 asyncio 版本，URL 與回傳格式與 routes/ 內的同步版完全相同：
+# 參數解析、SQL 與回傳內容都呼叫同步版的共用函式，這裡只負責以 aiomysql 查詢。
+# 熱門查詢的 SQL 與同步版共用 prepared_statements.HOT_QUERIES (aiomysql 同樣使用 %s 參數)。
+# 其餘路由 (寫入類) 由 asgi.py 轉交給原本的 Flask app 處理。
+async_bp = Blueprint('async_bp', __name__)
+
+# 條件式 GET 與同步版共用 conditional.py，改傳入 Quart 的 request / app
+etag_matches = partial(conditional.etag_matches, req=request)
+not_modified = partial(conditional.not_modified, app=current_app)
+json_with_etag = partial(conditional.json_with_etag, app=current_app)
+conditional_json = partial(conditional.conditional_json, req=request, app=current_app)
+
+# --- 登入 (對應 user_routes.login) ---
+@async_bp.route('/users/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+
+    if not email or not password:
+        return jsonify({"code": "1001", "message": "請提供 Email 與密碼"}), 400
+
+    try:
+        user = await fetch_one(HOT_QUERIES["user_login"], (email, password))
+
+        if user:
+            return jsonify(login_body(user)), 200
+        else:
+            return jsonify({"code": "1001", "message": "帳號或密碼不正確"}), 401
+    except Exception as e:
+        return jsonify({"code": "500", "message": str(e)}), 500
+
+# --- 取得使用者所有行程 (對應 trip_routes.get_all_trips) ---
+@async_bp.route('/trips/<int:user_id>', methods=['GET'])
+async def get_all_trips(user_id):
+    try:
+        opts = parse_trip_list_args(request.args)
+    except ValueError as e:
+        return jsonify({"code": "2010", "message": str(e)}), 400
+
+    try:
+        # 與同步版相同：先以 trips_version 比對 ETag，相符就不跑清單查詢
+        row = await fetch_one(TRIPS_VERSION_SQL, (user_id,))
+        tag = trip_list_etag(user_id, row['trips_version'] if row else 0, opts)
+        if etag_matches(tag):
+            return not_modified(tag)
+
+        trips = await fetch_all(*trip_list_query(user_id, opts))
+        return json_with_etag(trip_list_body(trips, opts), tag)
+    except Exception as e:
+        return jsonify({"code": "2001", "message": "取得失敗", "error": str(e)}), 500
+
+# --- 取得行程活動、類別統計與總額 (對應 event_routes.get_trip_events) ---
+@async_bp.route('/trips/<int:trip_id>/events', methods=['GET'])
+async def get_trip_events(trip_id):
+    cached, tag = trip_events_cache.get_with_etag(trip_id)
+    if cached is not None:
+        response, tag = conditional_json({"code": "200", "data": cached}, tag)
+        trip_events_cache.set_etag(trip_id, cached, tag)
+        return response
+
+    try:
+        # 兩個查詢互不相依，分別借連線同時送出
+        events, category_summaries = await asyncio.gather(
+            fetch_all(HOT_QUERIES["trip_events"], (trip_id,)),
+            fetch_all(HOT_QUERIES["trip_category_sums"], (trip_id,))
+        )
+
+        payload = trip_events_payload(events, category_summaries)
+        response, tag = conditional_json({"code": "200", "data": payload})
+        trip_events_cache.set(trip_id, payload, etag=tag)
+        return response
+    except Exception as e:
+        return jsonify({"code": "2005", "message": "取得資料失敗", "error": str(e)}), 500
+
+# --- 搜尋景點 (對應 place_routes.get_all_places) ---
+@async_bp.route('/places', methods=['GET'])
+async def get_all_places():
+    q, limit = parse_place_search_args(request.args)
+
+    try:
+        if q and Config.PLACE_INDEX_ENABLED:
+            # 索引重建是同步的資料庫操作，丟到執行緒避免卡住事件迴圈
+            await asyncio.to_thread(place_index.ensure_fresh)
+            tag = place_index_etag(q, limit)
+            if etag_matches(tag):
+                return not_modified(tag)
+            return json_with_etag(place_list_body(place_index.search(q, limit), q, limit), tag)
+
+        places = await fetch_all(*place_search_query(q, limit))
+        response, _ = conditional_json(place_list_body(places, q, limit))
+        return response
+    except Exception as e:
+        return jsonify({"code": "3001", "message": "取得景點失敗", "error": str(e)}), 500
+
+# --- 我的收藏 (對應 place_routes.get_my_favorites) ---
+@async_bp.route('/users/<int:user_id>/favorites', methods=['GET'])
+async def get_my_favorites(user_id):
+    try:
+        # 與同步版相同：以 favorites_version 比對 ETag 與快取版本
+        row = await fetch_one(HOT_QUERIES["user_favorites_version"], (user_id,))
+        tag = favorites_etag(user_id, row['favorites_version'] if row else 0)
+        if etag_matches(tag):
+            return not_modified(tag)
+
+        fav_places, cached_tag = user_favorites_cache.get_with_etag(user_id)
+        if fav_places is None or cached_tag != tag:
+            fav_places = await fetch_all(HOT_QUERIES["user_favorites"], (user_id,))
+            user_favorites_cache.set(user_id, fav_places, etag=tag)
+        return json_with_etag({"code": "200", "data": fav_places}, tag)
+    except Exception:
+        return jsonify({"code": "3002", "message": "取得收藏清單失敗"}), 500
+
+# --- 讀取個人評論與平均分數 (對應 place_routes.handle_private_review 的 GET) ---
+@async_bp.route('/users/<int:user_id>/places/<int:place_id>/review', methods=['GET'])
+async def get_private_review(user_id, place_id):
+    try:
+        user_review, stat = await asyncio.gather(
+            fetch_one(HOT_QUERIES["user_place_review"], (user_id, place_id)),
+            fetch_one(HOT_QUERIES["place_review_stat"], (place_id,))
+        )
+        return jsonify(private_review_body(user_review, place_stat_body(stat))), 200
+    except Exception as e:
+        return jsonify({"code": "3003", "message": "讀取評論失敗", "error": str(e)}), 500
@@ -1,16 +1,32 @@
 from flask import Blueprint, request, jsonify
 from database import get_db_connection
-from datetime import timedelta
+from cache import trip_events_cache
+from conditional import conditional_json
+from expense_rollups import RollupDelta
+import prepared_statements
+import query_log
 
 event_bp = Blueprint('event_bp', __name__)
 
-def format_timedelta(data):
-    if isinstance(data, list):
-        for item in data:
-            for key, value in item.items():
-                if isinstance(value, timedelta):
-                    item[key] = str(value)
-    return data
+def get_event_expense(cursor, event_id):
+    # 鎖住活動與帳目，回傳 (trip_id, day_no, category, amount)；帳目不存在時後三者為 None
+    # (以 JOIN 到的 Events_id 判斷帳目是否存在，amount / category 本身可能就是 NULL)
+    cursor.execute("""
+        SELECT e.Trips_id, e.day_no, ex.Events_id, ex.category, ex.amount
+        FROM events e
+        LEFT JOIN expenses ex ON ex.Events_id = e.id
+        WHERE e.id = %s
+        FOR UPDATE
+    """, (event_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if isinstance(row, dict):
+        row = (row['Trips_id'], row['day_no'], row['Events_id'], row['category'], row['amount'])
+    trip_id, day_no, expense_event_id, category, amount = row
+    if expense_event_id is None:
+        return trip_id, None, None, None
+    return trip_id, day_no, category, amount
 
 # --- 1. 新增活動與帳目 (金額僅存入 expenses) ---
 @event_bp.route('/events/<int:trip_id>', methods=['POST'])
@@ -39,7 +55,13 @@ def add_event(trip_id):
         """
         cursor.execute(sql_expense, (trip_id, new_event_id, data.get('cost', 0), data.get('category', '其他')))
 
+        # C. 更新每日/類別花費小計
+        rollup = RollupDelta()
+        rollup.add(trip_id, data.get('day_no', 1), data.get('category', '其他'), data.get('cost', 0))
+        rollup.apply(cursor)
+
         conn.commit()
+        trip_events_cache.invalidate(trip_id)
         return jsonify({"code": "200", "message": "活動與帳目已新增"}), 200
     except Exception as e:
         conn.rollback()
@@ -48,51 +70,38 @@ def add_event(trip_id):
         cursor.close()
         conn.close()
 
+def trip_events_payload(events, category_summaries):
+    # 全行程總花費由類別統計加總 (同步版與 async_routes 共用)
+    return {
+        "total_spent": sum(item['total_amount'] for item in category_summaries),
+        "category_summaries": category_summaries,
+        "events": events
+    }
+
 # --- 2. 取得行程活動、類別統計與總額 (金額統一來自 expenses) ---
 @event_bp.route('/trips/<int:trip_id>/events', methods=['GET'])
 def get_trip_events(trip_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    cached, tag = trip_events_cache.get_with_etag(trip_id)
+    if cached is not None:
+        response, tag = conditional_json({"code": "200", "data": cached}, tag)
+        trip_events_cache.set_etag(trip_id, cached, tag)
+        return response
+
+    conn = get_db_connection(statements=True)
     try:
-        # A. 查詢所有活動與來自 expenses 的金額
-        sql_events = """
-            SELECT 
-                e.id, e.Trips_id, e.day_no, e.title, 
-                e.start_time, e.end_time, e.place_name, 
-                ex.category, ex.amount AS expense 
-            FROM events e
-            LEFT JOIN expenses ex ON e.id = ex.Events_id
-            WHERE e.Trips_id = %s
-            ORDER BY e.day_no ASC, e.start_time ASC
-        """
-        cursor.execute(sql_events, (trip_id,))
-        events = cursor.fetchall()
+        # A. 查詢所有活動與來自 expenses 的金額 (prepared statement，見 prepared_statements.py)
+        events = prepared_statements.fetch_all(conn, "trip_events", (trip_id,))
 
         # B. 統計各類別花費
-        sql_category_sum = """
-            SELECT category, SUM(amount) AS total_amount
-            FROM expenses
-            WHERE Trips_id = %s
-            GROUP BY category
-        """
-        cursor.execute(sql_category_sum, (trip_id,))
-        category_summaries = cursor.fetchall()
+        category_summaries = prepared_statements.fetch_all(conn, "trip_category_sums", (trip_id,))
 
-        # C. 計算全行程總花費
-        total_spent = sum(item['total_amount'] for item in category_summaries)
-
-        return jsonify({
-            "code": "200",
-            "data": {
-                "total_spent": total_spent,
-                "category_summaries": category_summaries,
-                "events": format_timedelta(events)
-            }
-        }), 200
+        payload = trip_events_payload(events, category_summaries)
+        response, tag = conditional_json({"code": "200", "data": payload})
+        trip_events_cache.set(trip_id, payload, etag=tag, replica=conn.is_replica)
+        return response
     except Exception as e:
         return jsonify({"code": "2005", "message": "取得資料失敗", "error": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
 
 # --- 3. 編輯活動 (僅更新 expenses 中的金額) ---
@@ -102,6 +111,9 @@ def update_event(event_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        old = get_event_expense(cursor, event_id)
+        trip_id = old[0] if old else None
+
         # 1. 更新活動資訊 (不再更新 planned_cost)
         sql_event = """
             UPDATE events 
@@ -117,7 +129,15 @@ def update_event(event_id):
         sql_expense = "UPDATE expenses SET amount=%s, category=%s WHERE Events_id=%s"
         cursor.execute(sql_expense, (data.get('cost'), data.get('category'), event_id))
 
+        # 3. 小計：扣掉舊的帳目、加上新的 (沒有帳目的活動不影響小計)
+        if old and old[3] is not None:
+            rollup = RollupDelta()
+            rollup.remove(*old)
+            rollup.add(trip_id, data.get('day_no'), data.get('category'), data.get('cost'))
+            rollup.apply(cursor)
+
         conn.commit()
+        trip_events_cache.invalidate(trip_id)
         return jsonify({"code": "200", "message": "活動與帳目已更新"}), 200
     except Exception as e:
         conn.rollback()
@@ -132,13 +152,199 @@ def delete_event(event_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        old = get_event_expense(cursor, event_id)
+        trip_id = old[0] if old else None
         cursor.execute("DELETE FROM expenses WHERE Events_id = %s", (event_id,))
         cursor.execute("DELETE FROM events WHERE id = %s", (event_id,))
+        if old and old[3] is not None:
+            rollup = RollupDelta()
+            rollup.remove(*old)
+            rollup.apply(cursor)
         conn.commit()
+        trip_events_cache.invalidate(trip_id)
         return jsonify({"code": "200", "message": "活動及其帳目已刪除"}), 200
     except Exception as e:
         conn.rollback()
         return jsonify({"code": "2008", "message": "刪除失敗", "error": str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# --- 5. 批次新增活動與帳目 (匯入整份行程) ---
+# Body: [{day_no, title, start_time, end_time, place_name, cost, category}, ...]
+# 或 {"events": [...]}；同一個交易內以多列 INSERT 寫入，回傳依序對應的新活動 id
+BULK_CHUNK_SIZE = 500
+
+@event_bp.route('/events/<int:trip_id>/bulk', methods=['POST'])
+def add_events_bulk(trip_id):
+    data = request.json
+    items = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items or not all(isinstance(i, dict) for i in items):
+        return jsonify({"code": "2009", "message": "請提供活動陣列"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # 先建立快照：之後讀回新 id 時看不到其他交易在這之後寫入的活動
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        new_event_ids = []
+        rollup = RollupDelta()
+        with query_log.chunked():
+            for start in range(0, len(items), BULK_CHUNK_SIZE):
+                chunk = items[start:start + BULK_CHUNK_SIZE]
+
+                # A. 多列插入活動；lastrowid 為第一列的 id，但 id 不保證連續
+                #    (innodb_autoinc_lock_mode=2、auto_increment_increment > 1)，依序讀回這批的 id
+                sql_event = (
+                    "INSERT INTO events (Trips_id, day_no, title, start_time, end_time, place_name) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))
+                )
+                params = []
+                for item in chunk:
+                    params.extend((
+                        trip_id, item.get('day_no', 1), item.get('title'),
+                        item.get('start_time'), item.get('end_time'),
+                        item.get('place_name')
+                    ))
+                cursor.execute(sql_event, params)
+                cursor.execute(
+                    "SELECT id FROM events WHERE Trips_id = %s AND id >= %s ORDER BY id ASC LIMIT %s",
+                    (trip_id, cursor.lastrowid, len(chunk) + 1)
+                )
+                chunk_ids = [row[0] for row in cursor.fetchall()]
+                if len(chunk_ids) != len(chunk):
+                    raise RuntimeError(f"讀回的活動 id 數量 ({len(chunk_ids)}) 與寫入筆數 ({len(chunk)}) 不符")
+
+                # B. 多列插入帳目
+                sql_expense = (
+                    "INSERT INTO expenses (Trips_id, Events_id, amount, category) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+                )
+                params = []
+                for event_id, item in zip(chunk_ids, chunk):
+                    params.extend((trip_id, event_id, item.get('cost', 0), item.get('category', '其他')))
+                    rollup.add(trip_id, item.get('day_no', 1), item.get('category', '其他'), item.get('cost', 0))
+                cursor.execute(sql_expense, params)
+
+                new_event_ids.extend(chunk_ids)
+
+        # C. 每日/類別小計在同一個交易內一次更新
+        rollup.apply(cursor)
+
+        conn.commit()
+        trip_events_cache.invalidate(trip_id)
+        return jsonify({
+            "code": "200",
+            "message": f"已批次新增 {len(new_event_ids)} 筆活動與帳目",
+            "event_ids": new_event_ids
+        }), 200
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"code": "2006", "message": "新增失敗", "error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- 6. 批次取得多個行程的活動與類別統計 (儀表板用，避免 N+1) ---
+# GET /api/users/<user_id>/trips/events  或  GET /api/trips/events?ids=1,2,3
+# 不論行程數量，最多只發 3 個查詢；已在快取中的行程不再查詢
+MAX_BATCH_TRIPS = 200
+
+def load_trips_events(cursor, trip_ids, replica=False):
+    # 回傳 {trip_id: {total_spent, category_summaries, events}}；replica 表示 cursor 連的是唯讀副本
+    payloads = {}
+    missing = []
+    for trip_id in trip_ids:
+        cached = trip_events_cache.get(trip_id)
+        if cached is not None:
+            payloads[trip_id] = cached
+        else:
+            missing.append(trip_id)
+    if not missing:
+        return payloads
+
+    placeholders = ", ".join(["%s"] * len(missing))
+    cursor.execute(f"""
+        SELECT 
+            e.id, e.Trips_id, e.day_no, e.title, 
+            e.start_time, e.end_time, e.place_name, 
+            ex.category, ex.amount AS expense 
+        FROM events e
+        LEFT JOIN expenses ex ON e.id = ex.Events_id
+        WHERE e.Trips_id IN ({placeholders})
+        ORDER BY e.Trips_id ASC, e.day_no ASC, e.start_time ASC
+    """, missing)
+    events = cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT Trips_id, category, SUM(amount) AS total_amount
+        FROM expenses
+        WHERE Trips_id IN ({placeholders})
+        GROUP BY Trips_id, category
+    """, missing)
+    sums = cursor.fetchall()
+
+    # 單次走訪分組
+    grouped = {trip_id: {"total_spent": 0, "category_summaries": [], "events": []} for trip_id in missing}
+    for event in events:
+        grouped[event['Trips_id']]["events"].append(event)
+    for row in sums:
+        payload = grouped[row.pop('Trips_id')]
+        payload["category_summaries"].append(row)
+        payload["total_spent"] += row['total_amount']
+
+    for trip_id, payload in grouped.items():
+        trip_events_cache.set(trip_id, payload, replica=replica)
+    payloads.update(grouped)
+    return payloads
+
+def batch_events_response(cursor, trip_ids, replica=False):
+    payloads = load_trips_events(cursor, trip_ids, replica)
+    return jsonify({
+        "code": "200",
+        "data": [{"trip_id": trip_id, **payloads[trip_id]} for trip_id in trip_ids],
+        "meta": {"count": len(trip_ids)}
+    }), 200
+
+@event_bp.route('/users/<int:user_id>/trips/events', methods=['GET'])
+def get_user_trips_events(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id FROM trips
+            WHERE Users_id = %s
+            ORDER BY start_datetime DESC, id DESC
+            LIMIT %s
+        """, (user_id, MAX_BATCH_TRIPS))
+        trip_ids = [row['id'] for row in cursor.fetchall()]
+        return batch_events_response(cursor, trip_ids, conn.is_replica)
+    except Exception as e:
+        return jsonify({"code": "2005", "message": "取得資料失敗", "error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+@event_bp.route('/trips/events', methods=['GET'])
+def get_trips_events():
+    try:
+        trip_ids = list(dict.fromkeys(
+            int(i) for i in (request.args.get('ids') or '').split(',') if i.strip()
+        ))
+    except ValueError:
+        return jsonify({"code": "2005", "message": "ids 格式錯誤"}), 400
+    if not trip_ids:
+        return jsonify({"code": "2005", "message": "請提供 ids"}), 400
+    if len(trip_ids) > MAX_BATCH_TRIPS:
+        return jsonify({"code": "2005", "message": f"一次最多 {MAX_BATCH_TRIPS} 個行程"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return batch_events_response(cursor, trip_ids, conn.is_replica)
+    except Exception as e:
+        return jsonify({"code": "2005", "message": "取得資料失敗", "error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,57 +1,95 @@
 from flask import Blueprint, request, jsonify
 from database import get_db_connection
 from datetime import datetime
+import csv
+import io
+import json
+from config import Config
+from place_index import place_index
+from place_popularity import place_popularity, autocomplete, LEADERBOARD_KINDS, AUTOCOMPLETE_MAX_K
+from review_stats import apply_review_change, get_place_stat
+from user_counters import bump, get_favorites_version, favorites_etag
+from cache import user_favorites_cache
+from conditional import etag_matches, not_modified, json_with_etag, conditional_json, derive_etag
+import prepared_statements
+import query_log
 
 place_bp = Blueprint('place_bp', __name__)
 
-@place_bp.route('/places', methods=['GET'])
-def get_all_places():
+# 景點搜尋的參數、SQL 與回傳內容 (同步版與 async_routes 共用，不碰 request / 資料庫)
+def parse_place_search_args(args):
     # 取得 query string 參數
-    q = (request.args.get('q') or '').strip()
-    limit = request.args.get('limit', default=50, type=int)
+    q = (args.get('q') or '').strip()
+    limit = args.get('limit', default=50, type=int)
 
     # limit 安全限制，避免惡意一次拉爆 DB
     if limit <= 0:
         limit = 10
     if limit > 200:
         limit = 200
+    return q, limit
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+def place_index_etag(q, limit):
+    # ETag 跟著本 worker 的索引版本走 (版本帶隨機前綴，不同 worker 不會撞號)
+    return derive_etag(place_index.version, q, limit)
 
-    try:
+def place_search_query(q, limit):
+    # 回傳 (sql, params)
+    if q:
         # 若有關鍵字：用 LIKE 搜尋
-        if q:
-            sql = """
-                SELECT id AS place_id, name
-                FROM places
-                WHERE name LIKE %s
-                ORDER BY name ASC
-                LIMIT %s
-            """
-            like_kw = f"%{q}%"
-            cursor.execute(sql, (like_kw, limit))
-        else:
-            # 若沒帶關鍵字：回傳前 N 筆（你也可以改成直接回傳 []）
-            sql = """
-                SELECT id AS place_id, name
-                FROM places
-                ORDER BY id DESC
-                LIMIT %s
-            """
-            cursor.execute(sql, (limit,))
+        return """
+            SELECT id AS place_id, name
+            FROM places
+            WHERE name LIKE %s
+            ORDER BY name ASC
+            LIMIT %s
+        """, (f"%{q}%", limit)
+    # 若沒帶關鍵字：回傳前 N 筆（你也可以改成直接回傳 []）
+    return """
+        SELECT id AS place_id, name
+        FROM places
+        ORDER BY id DESC
+        LIMIT %s
+    """, (limit,)
 
-        places = cursor.fetchall()
+def place_list_body(places, q, limit):
+    return {
+        "code": "200",
+        "data": places,
+        "meta": {
+            "q": q,
+            "limit": limit,
+            "count": len(places)
+        }
+    }
 
-        return jsonify({
-            "code": "200",
-            "data": places,
-            "meta": {
-                "q": q,
-                "limit": limit,
-                "count": len(places)
-            }
-        }), 200
+@place_bp.route('/places', methods=['GET'])
+def get_all_places():
+    q, limit = parse_place_search_args(request.args)
+
+    # 有關鍵字時直接查記憶體索引，不碰資料庫
+    if q and Config.PLACE_INDEX_ENABLED:
+        try:
+            place_index.ensure_fresh()
+            tag = place_index_etag(q, limit)
+        except Exception as e:
+            return jsonify({
+                "code": "3001",
+                "message": "取得景點失敗",
+                "error": str(e)
+            }), 500
+        if etag_matches(tag):
+            return not_modified(tag)
+        return json_with_etag(place_list_body(place_index.search(q, limit), q, limit), tag)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute(*place_search_query(q, limit))
+        # 資料來自資料庫，ETag 以輸出內容計算，才不會因本 worker 索引尚未重建而回錯 304
+        response, _ = conditional_json(place_list_body(cursor.fetchall(), q, limit))
+        return response
 
     except Exception as e:
         return jsonify({
@@ -63,6 +101,97 @@ def get_all_places():
         cursor.close()
         conn.close()
 
+def update_favorites_cache(user_id, place_id, added, version):
+    # 收藏清單快取採整份替換 (不修改既有 list)，在快取鎖內完成讀-改-寫，
+    # 同一位使用者同時收藏不同景點也不會互相覆蓋；名稱查不到時直接讓快取失效。
+    # version 為這次異動後的 favorites_version：快取必須正好是前一版才套用，
+    # 否則代表中間有其他 worker 的異動沒反映在快取中，直接失效
+    name = place_index.get_name(place_id) if added else None
+
+    def apply(cached):
+        if not added:
+            return [p for p in cached if p['place_id'] != place_id]
+        if name is None:
+            return None
+        if any(p['place_id'] == place_id for p in cached):
+            return cached
+        return cached + [{"place_id": place_id, "name": name}]
+
+    updated = user_favorites_cache.update(
+        user_id, apply,
+        etag=favorites_etag(user_id, version),
+        expect_etag=favorites_etag(user_id, version - 1))
+    if not updated:
+        # 不在快取中：仍記下失效時間，讓接下來從副本讀到的舊清單不會被回填
+        user_favorites_cache.invalidate(user_id)
+
+# --- 1-1. 景點名稱自動完成 (前綴比對，依熱門度排序) ---
+# Query: ?q=台北&limit=10
+@place_bp.route('/places/autocomplete', methods=['GET'])
+def autocomplete_places():
+    q = (request.args.get('q') or '').strip()
+    limit = request.args.get('limit', default=10, type=int)
+    if limit <= 0:
+        limit = 10
+    # 最多回傳 AUTOCOMPLETE_MAX_K 筆，meta.limit 回報實際套用的上限
+    limit = min(limit, AUTOCOMPLETE_MAX_K)
+
+    if not q:
+        return jsonify({"code": "200", "data": [], "meta": {"q": q, "limit": limit, "count": 0}}), 200
+
+    try:
+        place_index.ensure_fresh()
+        place_popularity.ensure_fresh()
+        places = autocomplete(q, limit)
+    except Exception as e:
+        return jsonify({"code": "3006", "message": "自動完成失敗", "error": str(e)}), 500
+
+    return jsonify({
+        "code": "200",
+        "data": places,
+        "meta": {
+            "q": q,
+            "limit": limit,
+            "count": len(places)
+        }
+    }), 200
+
+# --- 1-2. 熱門景點排行榜 (依平均分或收藏數，記憶體內排序，不掃 reviews / favorites) ---
+# Query: ?by=score&limit=20   (by: score | favorites)
+@place_bp.route('/places/leaderboard', methods=['GET'])
+def place_leaderboard():
+    by = request.args.get('by', default='score')
+    limit = request.args.get('limit', default=20, type=int)
+    if by not in LEADERBOARD_KINDS:
+        return jsonify({"code": "3007", "message": "排行榜類型須為 score 或 favorites"}), 400
+    if limit <= 0:
+        limit = 20
+    limit = min(limit, Config.LEADERBOARD_MAX_K)
+
+    try:
+        place_index.ensure_fresh()
+        place_popularity.ensure_fresh()
+        tag = derive_etag(place_index.version, place_popularity.version, by, limit)
+        if etag_matches(tag):
+            return not_modified(tag)
+        places = [
+            {"rank": rank, "place_id": pid, "name": place_index.get_name(pid), **place_popularity.stats(pid)}
+            for rank, pid in enumerate(place_popularity.leaderboard(by, limit), start=1)
+        ]
+    except Exception as e:
+        return jsonify({"code": "3007", "message": "取得排行榜失敗", "error": str(e)}), 500
+
+    return json_with_etag({
+        "code": "200",
+        "data": places,
+        "meta": {
+            "by": by,
+            "limit": limit,
+            "min_reviews": Config.LEADERBOARD_MIN_REVIEWS,
+            "count": len(places)
+        }
+    }, tag)
+
 # --- 2. 加入/取消最愛 (切換狀態) ---
 @place_bp.route('/favorites', methods=['POST'])
 def toggle_favorite():
@@ -72,17 +201,33 @@ def toggle_favorite():
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # 檢查是否已收藏
-        cursor.execute("SELECT * FROM favorites WHERE Users_id = %s AND Places_id = %s", (user_id, place_id))
-        if cursor.fetchone():
-            cursor.execute("DELETE FROM favorites WHERE Users_id = %s AND Places_id = %s", (user_id, place_id))
+        user_id, place_id = int(user_id), int(place_id)
+
+        # 直接嘗試刪除：有刪到代表原本已收藏；沒刪到才插入。
+        # 不先 SELECT，DELETE 會鎖住該列；ON DUPLICATE KEY UPDATE 容許同時插入的競爭
+        # (重複時 rowcount 為 0)，但外鍵錯誤仍會拋出 (INSERT IGNORE 會把它吞成警告)
+        cursor.execute("DELETE FROM favorites WHERE Users_id = %s AND Places_id = %s", (user_id, place_id))
+        if cursor.rowcount:
+            added, delta = False, -1
             message = "已從最愛移除"
         else:
-            cursor.execute("INSERT INTO favorites (Users_id, Places_id) VALUES (%s, %s)", (user_id, place_id))
+            cursor.execute("""
+                INSERT INTO favorites (Users_id, Places_id) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE Users_id = Users_id
+            """, (user_id, place_id))
+            added, delta = True, 1 if cursor.rowcount else 0
             message = "已加入最愛"
+        version = None
+        if delta:
+            bump(cursor, user_id, favorites=delta)
+            version = get_favorites_version(cursor, user_id)
         conn.commit()
+        if delta:
+            update_favorites_cache(user_id, place_id, added, version)
+            place_popularity.apply_favorite(place_id, delta)
         return jsonify({"code": "200", "message": message}), 200
     except Exception as e:
+        conn.rollback()
         return jsonify({"code": "4001", "message": "操作失敗", "error": str(e)}), 500
     finally:
         cursor.close()
@@ -91,23 +236,24 @@ def toggle_favorite():
 # --- 3. 看到我自己收藏的 Favorite 地點 ---
 @place_bp.route('/users/<int:user_id>/favorites', methods=['GET'])
 def get_my_favorites(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db_connection(statements=True)
     try:
-        # 透過 favorites 表 JOIN places
-        sql = """
-            SELECT p.id AS place_id, p.name 
-            FROM favorites f
-            JOIN places p ON f.Places_id = p.id
-            WHERE f.Users_id = %s
-        """
-        cursor.execute(sql, (user_id,))
-        fav_places = cursor.fetchall()
-        return jsonify({"code": "200", "data": fav_places}), 200
-    except Exception as e:
+        # 先以主鍵查 favorites_version：ETag 相符直接回 304；
+        # 快取的版本相同才沿用，其他 worker 收藏 / 取消過就重新查詢
+        row = prepared_statements.fetch_one(conn, "user_favorites_version", (user_id,))
+        tag = favorites_etag(user_id, row['favorites_version'] if row else 0)
+        if etag_matches(tag):
+            return not_modified(tag)
+
+        fav_places, cached_tag = user_favorites_cache.get_with_etag(user_id)
+        if fav_places is None or cached_tag != tag:
+            # 透過 favorites 表 JOIN places (prepared statement，見 prepared_statements.py)
+            fav_places = prepared_statements.fetch_all(conn, "user_favorites", (user_id,))
+            user_favorites_cache.set(user_id, fav_places, etag=tag, replica=conn.is_replica)
+        return json_with_etag({"code": "200", "data": fav_places}, tag)
+    except Exception:
         return jsonify({"code": "3002", "message": "取得收藏清單失敗"}), 500
     finally:
-        cursor.close()
         conn.close()
 
 
@@ -159,48 +305,34 @@ def get_my_favorites(user_id):
 #             conn.close()
 
 # --- 4. 點開地點看到我自己的評論與全站平均分 ---
+def private_review_body(user_review, global_stat):
+    # 若無評論則給予預設值 (同步版與 async_routes 共用)
+    return {
+        "code": "200",
+        "data": {
+            "my_review": user_review or {"score": 0, "comment": ""},
+            "global_stat": global_stat
+        }
+    }
+
 @place_bp.route('/users/<int:user_id>/places/<int:place_id>/review', methods=['GET', 'POST'])
 def handle_private_review(user_id, place_id):
-    conn = get_db_connection()
+    # GET 只執行 prepared statement 熱門查詢，借用專用連線池
+    conn = get_db_connection(statements=request.method == 'GET')
     
     # --- GET: 讀取個人評論與平均分數 ---
     if request.method == 'GET':
-        cursor = conn.cursor(dictionary=True)
         try:
             # 1. 取得該使用者的個人評論
-            sql_user = "SELECT score, comment FROM reviews WHERE Users_id = %s AND Places_id = %s"
-            cursor.execute(sql_user, (user_id, place_id))
-            user_review = cursor.fetchone()
+            user_review = prepared_statements.fetch_one(conn, "user_place_review", (user_id, place_id))
             
-            # 若無評論則給予預設值
-            if not user_review:
-                user_review = {"score": 0, "comment": ""}
-
-            # 2. 計算該地點的平均分數與總評論數
-            sql_avg = """
-                SELECT 
-                    ROUND(AVG(score), 1) AS average_score, 
-                    COUNT(id) AS total_reviews 
-                FROM reviews 
-                WHERE Places_id = %s
-            """
-            cursor.execute(sql_avg, (place_id,))
-            global_stat = cursor.fetchone()
+            # 2. 讀取該地點預先彙總好的平均分數與總評論數
+            global_stat = get_place_stat(conn, place_id)
 
-            return jsonify({
-                "code": "200", 
-                "data": {
-                    "my_review": user_review,
-                    "global_stat": {
-                        "average_score": float(global_stat['average_score']) if global_stat['average_score'] else 0.0,
-                        "total_reviews": global_stat['total_reviews']
-                    }
-                }
-            }), 200
+            return jsonify(private_review_body(user_review, global_stat)), 200
         except Exception as e:
             return jsonify({"code": "3003", "message": "讀取評論失敗", "error": str(e)}), 500
         finally:
-            cursor.close()
             conn.close()
 
     # --- POST: 改寫(更新或新增) 評論 ---
@@ -210,6 +342,13 @@ def handle_private_review(user_id, place_id):
         comment = data.get('comment')
         cursor = conn.cursor()
         try:
+            # 先鎖住舊評論取得原分數，用來增量更新彙總
+            cursor.execute(
+                "SELECT score FROM reviews WHERE Users_id = %s AND Places_id = %s FOR UPDATE",
+                (user_id, place_id)
+            )
+            old = cursor.fetchone()
+
             # 使用 ON DUPLICATE KEY UPDATE 確保每人每地只有一筆
             sql = """
                 INSERT INTO reviews (Users_id, Places_id, score, comment)
@@ -217,7 +356,9 @@ def handle_private_review(user_id, place_id):
                 ON DUPLICATE KEY UPDATE score=%s, comment=%s, created_at=CURRENT_TIMESTAMP
             """
             cursor.execute(sql, (user_id, place_id, score, comment, score, comment))
+            apply_review_change(cursor, place_id, old[0] if old else None, score)
             conn.commit()
+            place_popularity.apply_review(place_id, old[0] if old else None, score)
             return jsonify({"code": "200", "message": "個人評論已改寫成功"}), 200
         except Exception as e:
             conn.rollback()
@@ -232,11 +373,22 @@ def delete_user_review(user_id, place_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        cursor.execute(
+            "SELECT score FROM reviews WHERE Users_id = %s AND Places_id = %s FOR UPDATE",
+            (user_id, place_id)
+        )
+        old = cursor.fetchone()
+
         sql = "DELETE FROM reviews WHERE Users_id = %s AND Places_id = %s"
         cursor.execute(sql, (user_id, place_id))
+        if old:
+            apply_review_change(cursor, place_id, old[0], None)
         conn.commit()
+        if old:
+            place_popularity.apply_review(place_id, old[0], None)
         return jsonify({"code": "200", "message": "已清除您的個人評論與評分"}), 200
     except Exception as e:
+        conn.rollback()
         return jsonify({"code": "3005", "message": "清除失敗", "error": str(e)}), 500
     finally:
         cursor.close()
@@ -265,6 +417,7 @@ def admin_add_place():
         cursor.execute(sql, (name,))
         
         conn.commit()
+        place_index.add(cursor.lastrowid, name)
         return jsonify({
             "code": "200",
             "message": f"成功新增公共景點: {name}",
@@ -288,18 +441,187 @@ def admin_delete_place(place_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
+        # CASCADE 會一併刪除收藏，先扣掉收藏者的收藏數
+        cursor.execute("""
+            UPDATE user_counters c
+            JOIN favorites f ON f.Users_id = c.Users_id
+            SET c.total_favorites = c.total_favorites - 1,
+                c.favorites_version = c.favorites_version + 1
+            WHERE f.Places_id = %s
+        """, (place_id,))
+
         # 執行刪除，CASCADE 會自動處理關聯表
         sql = "DELETE FROM places WHERE id = %s"
         cursor.execute(sql, (place_id,))
         
         if cursor.rowcount == 0:
+            conn.rollback()
             return jsonify({"code": "4006", "message": "找不到該景點，刪除失敗"}), 404
 
         conn.commit()
+        place_index.remove(place_id)
+        place_popularity.remove(place_id)
+        # CASCADE 刪掉的收藏分散在各使用者的快取中，直接全部清除
+        user_favorites_cache.clear()
         return jsonify({"code": "200", "message": "已將景點從公共庫徹底移除"}), 200
     except Exception as e:
         conn.rollback()
         return jsonify({"code": "4007", "message": "刪除失敗", "error": str(e)}), 500
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# --- 8. 管理員：批次匯入公共景點 (CSV 或 NDJSON，串流讀取) ---
+# Method: POST /api/admin/places/import
+# CSV：第一列為表頭且含 name 欄位；NDJSON：每行一個 {"name": "..."}
+# 依 Content-Type (text/csv / application/x-ndjson) 或 ?format=csv|ndjson 判斷格式
+MAX_IMPORT_ERRORS = 20
+IMPORT_STAGING = "place_import_names"
+
+def iter_import_names(stream, fmt):
+    # 逐行產生 (行號, 名稱, 錯誤原因)，不把整個檔案讀進記憶體
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise ValueError("CSV 表頭缺少 name 欄位")
+        for row in reader:
+            name = (row.get('name') or '').strip()
+            yield reader.line_num, name, None if name else "景點名稱不能為空"
+    else:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield line_no, None, "JSON 格式錯誤"
+                continue
+            name = item.get('name') if isinstance(item, dict) else None
+            if name is not None and not isinstance(name, str):
+                yield line_no, None, "景點名稱必須是字串"
+                continue
+            name = (name or '').strip()
+            yield line_no, name, None if name else "景點名稱不能為空"
+
+def create_import_staging(cursor):
+    # 與 places 相同欄位定義 (含 name 的定序) 的暫存表：重複判斷交給 MySQL，
+    # 大小寫 / 重音不同的名稱與 admin_add_place 的 WHERE name = %s 一樣視為同一個景點
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {IMPORT_STAGING}")
+    cursor.execute(f"CREATE TEMPORARY TABLE {IMPORT_STAGING} LIKE places")
+
+def drop_import_staging(cursor):
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {IMPORT_STAGING}")
+
+def import_place_chunk(conn, cursor, names):
+    # 名稱先寫入暫存表，依資料表定序去掉同批重複與已存在的名稱，剩下的以多列 INSERT 寫入，
+    # 回傳 (新增數, 略過數)
+    cursor.execute(f"DELETE FROM {IMPORT_STAGING}")
+    cursor.executemany(f"INSERT INTO {IMPORT_STAGING} (name) VALUES (%s)", [(n,) for n in names])
+    cursor.execute(f"""
+        SELECT MIN(s.name)
+        FROM {IMPORT_STAGING} s
+        WHERE NOT EXISTS (SELECT 1 FROM places p WHERE p.name = s.name)
+        GROUP BY s.name
+    """)
+    new_names = [row[0] for row in cursor.fetchall()]
+
+    added = []
+    if new_names:
+        cursor.execute(
+            "INSERT INTO places (name) VALUES " + ", ".join(["(%s)"] * len(new_names)),
+            new_names
+        )
+        # 多列 INSERT 的 id 不保證連續 (auto_increment_increment、交錯鎖定模式)，依名稱查回實際 id
+        placeholders = ", ".join(["%s"] * len(new_names))
+        cursor.execute(f"SELECT id, name FROM places WHERE name IN ({placeholders})", new_names)
+        added = cursor.fetchall()
+    conn.commit()
+
+    for place_id, name in added:
+        place_index.add(place_id, name)
+    return len(new_names), len(names) - len(new_names)
+
+@place_bp.route('/admin/places/import', methods=['POST'])
+def admin_import_places():
+    fmt = request.args.get('format') or ('csv' if 'csv' in (request.content_type or '') else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"code": "4008", "message": "format 僅支援 csv 或 ndjson"}), 400
+
+    inserted = skipped = errored = 0
+    errors = []
+
+    def record_error(line_no, reason):
+        nonlocal errored
+        errored += 1
+        if len(errors) < MAX_IMPORT_ERRORS:
+            errors.append({"line": line_no, "reason": reason})
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    staging = False
+
+    def flush(chunk):
+        nonlocal inserted, skipped
+        try:
+            added, dup = import_place_chunk(conn, cursor, [name for _, name in chunk])
+            inserted += added
+            skipped += dup
+        except Exception as e:
+            # 單批失敗只影響該批，其餘批次繼續匯入
+            conn.rollback()
+            for line_no, _ in chunk:
+                record_error(line_no, str(e))
+
+    try:
+        create_import_staging(cursor)
+        staging = True
+        chunk = []  # (行號, 名稱)
+        with query_log.chunked():
+            for line_no, name, error in iter_import_names(request.stream, fmt):
+                if error:
+                    record_error(line_no, error)
+                    continue
+                chunk.append((line_no, name))
+                if len(chunk) >= Config.PLACE_IMPORT_CHUNK:
+                    flush(chunk)
+                    chunk = []
+            if chunk:
+                flush(chunk)
+
+        return jsonify({
+            "code": "200",
+            "message": f"匯入完成：新增 {inserted} 筆、略過重複 {skipped} 筆、錯誤 {errored} 筆",
+            "data": {
+                "inserted": inserted,
+                "skipped": skipped,
+                "errored": errored,
+                "errors": errors
+            }
+        }), 200
+
+    except ValueError as e:
+        # 檔案本身的問題 (CSV 缺 name 表頭、不是 UTF-8)：屬於請求錯誤
+        conn.rollback()
+        return jsonify({
+            "code": "4008",
+            "message": "匯入檔案格式錯誤",
+            "error": str(e),
+            "data": {"inserted": inserted, "skipped": skipped, "errored": errored, "errors": errors}
+        }), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({
+            "code": "4008",
+            "message": "匯入失敗",
+            "error": str(e),
+            "data": {"inserted": inserted, "skipped": skipped, "errored": errored, "errors": errors}
+        }), 500
+    finally:
+        try:
+            if staging:
+                drop_import_staging(cursor)
+        except Exception:
+            pass  # 連線歸還時 reset session 也會清掉暫存表
+        cursor.close()
+        conn.close()
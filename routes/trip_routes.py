@@ -1,25 +1,112 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from database import get_db_connection
+from cache import trip_events_cache
+from conditional import etag_matches, not_modified, json_with_etag, derive_etag
+from user_counters import bump, get_trips_version
+from expense_rollups import get_trip_summary
+from config import Config
+import trip_export
+from datetime import datetime
+import base64
+import threading
+import json
 import mysql.connector
 
 trip_bp = Blueprint('trip_bp', __name__)
 
-# --- 1. 取得使用者所有行程 ---
+# fields= 可選的欄位；id 與 start_datetime 為分頁游標所需，一律查詢
+TRIP_FIELDS = ['id', 'Users_id', 'title', 'start_datetime', 'end_datetime', 'note', 'total_budget']
+
+def encode_cursor(trip):
+    raw = json.dumps([trip['start_datetime'].isoformat(), trip['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(token):
+    start_dt, trip_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return datetime.fromisoformat(start_dt), int(trip_id)
+
+# 行程清單的解析、SQL、ETag 與回傳內容 (同步版與 async_routes 共用，不碰 request / 資料庫)
+def parse_trip_list_args(args):
+    # 格式錯誤時拋出 ValueError，訊息直接回給前端
+    limit = args.get('limit', default=50, type=int)
+    if limit <= 0:
+        limit = 10
+    if limit > 200:
+        limit = 200
+
+    fields = [f.strip() for f in (args.get('fields') or '').split(',') if f.strip()]
+    if any(f not in TRIP_FIELDS for f in fields):
+        raise ValueError(f"fields 僅能為: {', '.join(TRIP_FIELDS)}")
+
+    after = None
+    token = args.get('cursor')
+    if token:
+        try:
+            after = decode_cursor(token)
+        except Exception:
+            raise ValueError("cursor 格式錯誤") from None
+    return {"limit": limit, "fields": fields, "token": token, "after": after}
+
+def trip_list_etag(user_id, version, opts):
+    # 由使用者的 trips_version 與查詢參數組成
+    return derive_etag('trips', user_id, version, opts["limit"], ','.join(opts["fields"]), opts["token"] or '')
+
+def trip_list_query(user_id, opts):
+    # 回傳 (sql, params)；未指定 fields 時維持原本的 SELECT *
+    fields, after = opts["fields"], opts["after"]
+    select_cols = ', '.join(dict.fromkeys(['id', 'start_datetime'] + fields)) if fields else '*'
+    # DB 欄位確認：使用 Users_id 與 start_datetime
+    # 建議索引：trips (Users_id, start_datetime, id)，每頁只掃描 limit + 1 筆
+    sql = f"SELECT {select_cols} FROM trips WHERE Users_id = %s"
+    params = [user_id]
+    if after:
+        sql += " AND (start_datetime < %s OR (start_datetime = %s AND id < %s))"
+        params.extend([after[0], after[0], after[1]])
+    sql += " ORDER BY start_datetime DESC, id DESC LIMIT %s"
+    params.append(opts["limit"] + 1)
+    return sql, params
+
+def trip_list_body(trips, opts):
+    limit, fields = opts["limit"], opts["fields"]
+    next_cursor = None
+    if len(trips) > limit:
+        trips = trips[:limit]
+        next_cursor = encode_cursor(trips[-1])
+
+    if fields:
+        trips = [{k: t[k] for k in fields} for t in trips]
+
+    return {
+        "code": "200",
+        "data": trips,
+        "meta": {
+            "limit": limit,
+            "count": len(trips),
+            "next_cursor": next_cursor
+        }
+    }
+
+# --- 1. 取得使用者所有行程 (以 (start_datetime, id) 做 keyset 分頁) ---
+# Query: ?limit=50&cursor=<meta.next_cursor>&fields=id,title,start_datetime
 @trip_bp.route('/<int:user_id>', methods=['GET'])
 def get_all_trips(user_id):
+    try:
+        opts = parse_trip_list_args(request.args)
+    except ValueError as e:
+        return jsonify({"code": "2010", "message": str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # DB 欄位確認：使用 Users_id 與 start_datetime
-        sql = "SELECT * FROM trips WHERE Users_id = %s ORDER BY start_datetime DESC"
-        cursor.execute(sql, (user_id,))
-        trips = cursor.fetchall()
+        # ETag 由使用者的 trips_version 與查詢參數組成：版本沒變就直接回 304，
+        # 只花一次主鍵查詢，不跑清單查詢也不序列化
+        tag = trip_list_etag(user_id, get_trips_version(cursor, user_id), opts)
+        if etag_matches(tag):
+            return not_modified(tag)
 
-        return jsonify({
-            "code": "200",
-            "data": trips
-        }), 200
+        cursor.execute(*trip_list_query(user_id, opts))
+        return json_with_etag(trip_list_body(cursor.fetchall(), opts), tag)
 
     except Exception as e:
         return jsonify({
@@ -56,6 +143,7 @@ def create_trip(user_id):
             VALUES (%s, %s, %s, %s, %s, %s)
         """
         cursor.execute(sql, (user_id, title, start_dt, end_dt, note, total_budget))
+        bump(cursor, user_id, trips=1)
         conn.commit()
 
         return jsonify({
@@ -64,6 +152,7 @@ def create_trip(user_id):
         }), 200
 
     except Exception as e:
+        conn.rollback()
         return jsonify({
             "code": "2002",
             "message": "行程建立失敗",
@@ -85,6 +174,10 @@ def update_trip(trip_id):
     cursor = conn.cursor()
 
     try:
+        # 先鎖住行程取得擁有者，修改後遞增擁有者的 trips_version
+        cursor.execute("SELECT Users_id FROM trips WHERE id = %s FOR UPDATE", (trip_id,))
+        owner = cursor.fetchone()
+
         sql = """
             UPDATE trips 
             SET title=%s, start_datetime=%s, end_datetime=%s, note=%s, total_budget=%s
@@ -98,6 +191,8 @@ def update_trip(trip_id):
             data.get('total_budget'),
             trip_id
         ))
+        if owner:
+            bump(cursor, owner[0], touch_trips=True)
         conn.commit()
 
         return jsonify({
@@ -106,6 +201,7 @@ def update_trip(trip_id):
         }), 200
 
     except Exception as e:
+        conn.rollback()
         return jsonify({
             "code": "2003",
             "message": "行程修改失敗",
@@ -122,9 +218,16 @@ def delete_trip(trip_id):
     cursor = conn.cursor()
 
     try:
+        # 先鎖住行程取得擁有者，刪除成功才扣行程數
+        cursor.execute("SELECT Users_id FROM trips WHERE id = %s FOR UPDATE", (trip_id,))
+        owner = cursor.fetchone()
+
         sql = "DELETE FROM trips WHERE id = %s"
         cursor.execute(sql, (trip_id,))
+        if owner and cursor.rowcount:
+            bump(cursor, owner[0], trips=-1)
         conn.commit()
+        trip_events_cache.invalidate(trip_id)
 
         return jsonify({
             "code": "200",
@@ -132,6 +235,7 @@ def delete_trip(trip_id):
         }), 200
 
     except Exception as e:
+        conn.rollback()
         return jsonify({
             "code": "2004",
             "message": "行程刪除失敗",
@@ -139,4 +243,103 @@ def delete_trip(trip_id):
         }), 500
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# --- 5. 行程預算摘要 (每日 / 類別花費與預算比較) ---
+@trip_bp.route('/<int:trip_id>/summary', methods=['GET'])
+def get_trip_budget_summary(trip_id):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        # 讀取預先彙總的小計，不掃描 expenses
+        summary = get_trip_summary(cursor, trip_id)
+        if summary is None:
+            return jsonify({"code": "2011", "message": "找不到該行程"}), 404
+
+        return jsonify({
+            "code": "200",
+            "data": summary
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            "code": "2011",
+            "message": "取得預算摘要失敗",
+            "error": str(e)
+        }), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+# --- 6. 匯出行程 (串流輸出 gzip 壓縮的 JSON 或 .ics 行事曆) ---
+# Query: ?format=json (預設，下載 .json.gz) 或 ?format=ics
+_export_slots = threading.BoundedSemaphore(Config.TRIP_EXPORT_MAX_CONCURRENT)
+
+def stream_export(where, params, filename, not_found=False):
+    fmt = request.args.get('format', default='json')
+    if fmt not in trip_export.EXPORT_FORMATS:
+        return jsonify({"code": "2012", "message": "format 僅能為 json 或 ics"}), 400
+
+    # 匯出在整個下載期間佔用一條連線，限制同時進行的數量，避免慢速下載佔滿連線池
+    if not _export_slots.acquire(blocking=False):
+        return jsonify({"code": "2012", "message": "匯出請求過多，請稍後再試"}), 429
+
+    state = {"finished": False}
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        _export_slots.release()
+        return jsonify({"code": "2012", "message": "匯出失敗", "error": str(e)}), 500
+    cursor = None
+
+    def cleanup():
+        # 讀完全部結果才歸還連線；沒讀完 (HEAD、用戶端中途斷線、出錯) 時直接斷開實體連線，
+        # 不把剩下的資料讀進記憶體
+        try:
+            if state["finished"]:
+                if cursor is not None:
+                    cursor.close()
+                conn.close()
+            else:
+                conn.discard()
+        finally:
+            _export_slots.release()
+
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(trip_export.EXPORT_SQL.format(where=where), params)
+        first_rows = cursor.fetchmany(Config.TRIP_EXPORT_BATCH)
+    except Exception as e:
+        cleanup()
+        return jsonify({"code": "2012", "message": "匯出失敗", "error": str(e)}), 500
+    if not first_rows and not_found:
+        state["finished"] = True
+        cleanup()
+        return jsonify({"code": "2011", "message": "找不到該行程"}), 404
+
+    def generate():
+        rows = trip_export.iter_rows(cursor, first_rows)
+        if fmt == 'ics':
+            yield from trip_export.ics_chunks(rows)
+        else:
+            yield from trip_export.gzip_chunks(trip_export.json_chunks(rows, current_app.json.dumps))
+        state["finished"] = True
+
+    if fmt == 'ics':
+        mimetype, filename = 'text/calendar; charset=utf-8', filename + '.ics'
+    else:
+        mimetype, filename = 'application/gzip', filename + '.json.gz'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.call_on_close(cleanup)
+    return response
+
+@trip_bp.route('/<int:trip_id>/export', methods=['GET'])
+def export_trip(trip_id):
+    return stream_export("t.id = %s", (trip_id,), f"trip-{trip_id}", not_found=True)
+
+# 匯出使用者的所有行程 (同一條查詢依行程排序，逐筆輸出)
+@trip_bp.route('/users/<int:user_id>/export', methods=['GET'])
+def export_user_trips(user_id):
+    return stream_export("t.Users_id = %s", (user_id,), f"user-{user_id}-trips")
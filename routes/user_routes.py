@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from database import get_db_connection
+import prepared_statements
 import mysql.connector
 
 user_bp = Blueprint('user_bp', __name__)
@@ -30,6 +31,20 @@ def register():
         cursor.close()
         conn.close()
         
+def login_body(user):
+    # 回傳格式必須是乾淨的 JSON，不能有 [cite] 標記 (同步版與 async_routes 共用)
+    return {
+        "code": "200",
+        "message": "登入成功",
+        "data": {
+            "id": user['id'],
+            "name": user['name'],
+            "email": user['email'],
+            "total_trips": str(user['total_trips']),
+            "total_favorites": str(user['total_favorites'])
+        }
+    }
+
 # --- 登入 API ---
 @user_bp.route('/login', methods=['POST'])
 def login():
@@ -40,41 +55,19 @@ def login():
     if not email or not password:
         return jsonify({"code": "1001", "message": "請提供 Email 與密碼"}), 400
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    conn = get_db_connection(statements=True)
 
     try:
-        # 使用子查詢統計行程與收藏
-        sql = """
-            SELECT 
-                u.id, u.name, u.email,
-                (SELECT COUNT(*) FROM trips WHERE users_id = u.id) AS total_trips,
-                (SELECT COUNT(*) FROM Favorites WHERE Users_id = u.id) AS total_favorites
-            FROM users u
-            WHERE u.email = %s AND u.password = %s
-        """
-        cursor.execute(sql, (email, password))
-        user = cursor.fetchone()
+        # 行程與收藏數由 user_counters 維護，不需再 COUNT (prepared statement，見 prepared_statements.py)
+        user = prepared_statements.fetch_one(conn, "user_login", (email, password))
 
         if user:
-            # 回傳格式必須是乾淨的 JSON，不能有 [cite] 標記
-            return jsonify({
-                "code": "200",
-                "message": "登入成功",
-                "data": {
-                    "id": user['id'],
-                    "name": user['name'],
-                    "email": user['email'],
-                    "total_trips": str(user['total_trips']),
-                    "total_favorites": str(user['total_favorites'])
-                }
-            }), 200
+            return jsonify(login_body(user)), 200
         else:
             return jsonify({"code": "1001", "message": "帳號或密碼不正確"}), 401
     except Exception as e:
         return jsonify({"code": "500", "message": str(e)}), 500
     finally:
-        cursor.close()
         conn.close()
         
 
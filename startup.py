@@ -0,0 +1,89 @@
+import threading
+import time
+from flask import jsonify
+from config import Config
+import database
+from place_index import place_index
+from place_popularity import place_popularity
+from review_stats import init_review_stats
+from user_counters import init_user_counters
+from expense_rollups import init_expense_rollups
+from prepared_statements import warm_statements
+
+# 啟動預熱：依序建立連線池、衍生資料表、景點索引與熱門度、prepared statement，每個階段計時並記錄。
+# 全部完成前 /readyz 回傳 503，滾動部署不會把流量導到還沒暖好的 worker；
+# /healthz 只代表行程還活著，不碰資料庫。
+
+def _warm_place_index():
+    if Config.PLACE_INDEX_ENABLED:
+        place_index.load_from_db()
+        place_popularity.load_from_db()
+
+# (階段名稱, 函式)；失敗的階段會在下一次 /readyz 時重試
+WARMUP_PHASES = [
+    ("db_pool", database.warm_pools),
+    ("review_stats", init_review_stats),      # 第一次建立時會從 reviews 重算
+    ("user_counters", init_user_counters),    # 第一次建立時會從 trips / favorites 校正
+    ("expense_rollups", init_expense_rollups),  # 第一次建立時會從 events / expenses 重算
+    ("place_index", _warm_place_index),       # 需在評分彙總表之後，熱門度才讀得到評分
+    ("prepared_statements", warm_statements),  # 每條常駐連線先 prepare 熱門查詢
+]
+
+_lock = threading.Lock()
+_state = {
+    "pending": [name for name, _ in WARMUP_PHASES],
+    "phases": {},  # 名稱 -> {"ok", "ms", "error"}
+    "last_attempt": None,
+}
+RETRY_SECONDS = 5
+
+def warm_up(app):
+    # 執行尚未成功的階段，回傳是否全部完成
+    with _lock:
+        _state["last_attempt"] = time.monotonic()
+        pending = list(_state["pending"])
+        total_start = time.perf_counter()
+        for name, fn in WARMUP_PHASES:
+            if name not in pending:
+                continue
+            start = time.perf_counter()
+            try:
+                fn()
+                error = None
+            except Exception as e:
+                error = str(e)
+            ms = round((time.perf_counter() - start) * 1000, 1)
+            _state["phases"][name] = {"ok": error is None, "ms": ms, "error": error}
+            if error is None:
+                _state["pending"].remove(name)
+                app.logger.info(f"啟動階段 {name} 完成 ({ms} ms)")
+            else:
+                app.logger.warning(f"啟動階段 {name} 失敗 ({ms} ms)：{error}")
+        if pending:
+            app.logger.info(f"啟動預熱耗時 {(time.perf_counter() - total_start) * 1000:.1f} ms，"
+                            f"未完成：{_state['pending'] or '無'}")
+        return not _state["pending"]
+
+def is_warm():
+    return not _state["pending"]
+
+def init_health(app):
+    @app.route('/healthz')
+    def healthz():
+        return jsonify({"code": "200", "status": "ok"}), 200
+
+    @app.route('/readyz')
+    def readyz():
+        warm = is_warm()
+        if not warm and time.monotonic() - (_state["last_attempt"] or 0) > RETRY_SECONDS:
+            warm = warm_up(app)
+        db_ok, pools = database.check_pools()
+        ready = warm and db_ok
+        body = {
+            "code": "200" if ready else "503",
+            "status": "ready" if ready else "not_ready",
+            "phases": dict(_state["phases"]),
+            "pending": list(_state["pending"]),
+            "db": pools,
+        }
+        return jsonify(body), 200 if ready else 503
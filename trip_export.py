@@ -0,0 +1,183 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from config import Config
+
+# 行程匯出：以未緩衝 cursor 逐批讀取 trips / events / expenses (依行程、天數、時間排序)，
+# 邊讀邊輸出 JSON (gzip 串流壓縮) 或 iCalendar，記憶體用量與行程大小、行程數量無關。
+# 活動時間 = 行程開始日 + (day_no - 1) 天 + start_time / end_time；結束早於開始視為跨午夜。
+
+EXPORT_FORMATS = ('json', 'ics')
+
+EXPORT_SQL = """
+    SELECT 
+        t.id AS trip_id, t.title AS trip_title, t.start_datetime, t.end_datetime,
+        t.note, t.total_budget,
+        e.id AS event_id, e.day_no, e.title, e.start_time, e.end_time, e.place_name,
+        ex.category, ex.amount
+    FROM trips t
+    LEFT JOIN events e ON e.Trips_id = t.id
+    LEFT JOIN expenses ex ON ex.Events_id = e.id
+    WHERE {where}
+    ORDER BY t.id ASC, e.day_no ASC, e.start_time ASC, e.id ASC
+"""
+
+def iter_rows(cursor, first_rows=()):
+    # first_rows：呼叫端為判斷行程是否存在而先讀出的第一批
+    yield from first_rows
+    while True:
+        rows = cursor.fetchmany(Config.TRIP_EXPORT_BATCH)
+        if not rows:
+            return
+        yield from rows
+
+def event_day(trip_start, day_no):
+    if trip_start is None:
+        return None
+    return datetime.combine(trip_start.date(), datetime.min.time()) + timedelta(days=(day_no or 1) - 1)
+
+def event_times(trip_start, day_no, start_time, end_time):
+    # 回傳 (開始, 結束)；沒有開始時間時皆為 None (視為整天的活動)
+    day = event_day(trip_start, day_no)
+    if day is None or start_time is None:
+        return None, None
+    start = day + start_time
+    end = day + end_time if end_time is not None else None
+    if end is not None and end < start:
+        end += timedelta(days=1)
+    return start, end
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+# --- JSON ---
+def json_chunks(rows, dumps):
+    # {"code": "200", "trips": [{...行程欄位, "events": [...], "total_spent": n}, ...]}
+    yield '{"code": "200", "exported_at": ' + dumps(_iso(datetime.now())) + ', "trips": ['
+    current = None
+    spent = Decimal(0)
+    first_event = True
+    for row in rows:
+        if row['trip_id'] != current:
+            if current is not None:
+                yield '], "total_spent": ' + dumps(spent) + '}, '
+            current = row['trip_id']
+            spent = Decimal(0)
+            first_event = True
+            trip = {
+                "id": row['trip_id'],
+                "title": row['trip_title'],
+                "start_datetime": _iso(row['start_datetime']),
+                "end_datetime": _iso(row['end_datetime']),
+                "note": row['note'],
+                "total_budget": row['total_budget'],
+            }
+            # 去掉結尾的 }，接著串流輸出 events 陣列
+            yield dumps(trip)[:-1] + ', "events": ['
+        if row['event_id'] is None:
+            continue
+        start, end = event_times(row['start_datetime'], row['day_no'], row['start_time'], row['end_time'])
+        event = {
+            "id": row['event_id'],
+            "day_no": row['day_no'],
+            "title": row['title'],
+            "start_at": _iso(start),
+            "end_at": _iso(end),
+            "place_name": row['place_name'],
+            "category": row['category'],
+            "expense": row['amount'],
+        }
+        spent += row['amount'] or 0
+        yield ('' if first_event else ', ') + dumps(event)
+        first_event = False
+    if current is not None:
+        yield '], "total_spent": ' + dumps(spent) + '}'
+    yield ']}\n'
+
+def gzip_chunks(chunks, level=6):
+    # 串流 gzip：壓縮器累積到一定大小才吐出資料，不需整份放在記憶體
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+# --- iCalendar (RFC 5545) ---
+def _ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def _ics_line(name, value):
+    # 每行最多 75 bytes，超過時折行 (續行以空白開頭)，不切斷 UTF-8 字元
+    line = f"{name}:{value}"
+    if len(line.encode('utf-8')) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], '', 0
+    for ch in line:
+        n = len(ch.encode('utf-8'))
+        if size + n > 75:
+            parts.append(current)
+            current, size = '', 1
+        current += ch
+        size += n
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+def _ics_time(name, value, all_day=False):
+    # 資料庫時間不帶時區，輸出為 floating time (依行事曆所在時區顯示)
+    if all_day:
+        return _ics_line(f"{name};VALUE=DATE", value.strftime('%Y%m%d'))
+    return _ics_line(name, value.strftime('%Y%m%dT%H%M%S'))
+
+def ics_chunks(rows):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//trip_web_backend//trip export//ZH\r\n"
+           "CALSCALE:GREGORIAN\r\n")
+    current = None
+    for row in rows:
+        if row['trip_id'] != current:
+            current = row['trip_id']
+            # 整趟行程本身也是一個事件
+            if row['start_datetime'] is not None:
+                lines = [
+                    "BEGIN:VEVENT\r\n",
+                    _ics_line("UID", f"trip-{current}@trip-web"),
+                    _ics_line("DTSTAMP", stamp),
+                    _ics_time("DTSTART", row['start_datetime']),
+                ]
+                if row['end_datetime'] is not None:
+                    lines.append(_ics_time("DTEND", row['end_datetime']))
+                lines.append(_ics_line("SUMMARY", _ics_text(row['trip_title'] or '')))
+                if row['note']:
+                    lines.append(_ics_line("DESCRIPTION", _ics_text(row['note'])))
+                lines.append("END:VEVENT\r\n")
+                yield ''.join(lines)
+        if row['event_id'] is None:
+            continue
+
+        start, end = event_times(row['start_datetime'], row['day_no'], row['start_time'], row['end_time'])
+        lines = [
+            "BEGIN:VEVENT\r\n",
+            _ics_line("UID", f"event-{row['event_id']}@trip-web"),
+            _ics_line("DTSTAMP", stamp),
+        ]
+        if start is not None:
+            lines.append(_ics_time("DTSTART", start))
+            if end is not None:
+                lines.append(_ics_time("DTEND", end))
+        else:
+            day = event_day(row['start_datetime'], row['day_no'])
+            if day is None:
+                continue
+            lines.append(_ics_time("DTSTART", day, all_day=True))
+        lines.append(_ics_line("SUMMARY", _ics_text(row['title'] or '')))
+        if row['place_name']:
+            lines.append(_ics_line("LOCATION", _ics_text(row['place_name'])))
+        description = f"行程：{row['trip_title'] or ''}"
+        if row['amount'] is not None:
+            description += f"\n{row['category'] or '其他'}：{row['amount']}"
+        lines.append(_ics_line("DESCRIPTION", _ics_text(description)))
+        lines.append("END:VEVENT\r\n")
+        yield ''.join(lines)
+    yield "END:VCALENDAR\r\n"
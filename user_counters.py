@@ -0,0 +1,129 @@
+import sys
+from database import get_db_connection
+from conditional import derive_etag
+
+# 每位使用者的行程數與收藏數，由 create_trip / delete_trip / toggle_favorite
+# 在同一個交易內增減，登入時只需一次以主鍵查詢。
+# trips_version / favorites_version 在行程或收藏異動時遞增，get_all_trips 與
+# get_my_favorites 以它組 ETag、檢查快取是否過期 (其他 worker 的異動也看得到)，
+# 內容沒變時只需一次主鍵查詢就能回 304。
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS user_counters (
+        Users_id INT NOT NULL PRIMARY KEY,
+        total_trips INT NOT NULL DEFAULT 0,
+        total_favorites INT NOT NULL DEFAULT 0,
+        trips_version BIGINT NOT NULL DEFAULT 0,
+        favorites_version BIGINT NOT NULL DEFAULT 0,
+        FOREIGN KEY (Users_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+"""
+
+VERSION_COLUMNS = ('trips_version', 'favorites_version')
+
+def ensure_table(cursor):
+    # 回傳 True 代表資料表是這次才建立，需要先校正一次
+    cursor.execute("SHOW TABLES LIKE 'user_counters'")
+    exists = cursor.fetchone() is not None
+    if not exists:
+        cursor.execute(CREATE_TABLE_SQL)
+    else:
+        # 舊版資料表沒有版本欄位
+        for column in VERSION_COLUMNS:
+            cursor.execute(f"SHOW COLUMNS FROM user_counters LIKE '{column}'")
+            if cursor.fetchone() is None:
+                cursor.execute(f"ALTER TABLE user_counters ADD COLUMN {column} BIGINT NOT NULL DEFAULT 0")
+    return not exists
+
+def bump(cursor, user_id, trips=0, favorites=0, touch_trips=False):
+    # 行程數有變動或 touch_trips=True (修改行程) 時遞增 trips_version；
+    # 收藏數有變動時遞增 favorites_version
+    trips_changed = 1 if trips or touch_trips else 0
+    favorites_changed = 1 if favorites else 0
+    cursor.execute("""
+        INSERT INTO user_counters (Users_id, total_trips, total_favorites, trips_version, favorites_version)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            total_trips = total_trips + VALUES(total_trips),
+            total_favorites = total_favorites + VALUES(total_favorites),
+            trips_version = trips_version + VALUES(trips_version),
+            favorites_version = favorites_version + VALUES(favorites_version)
+    """, (user_id, trips, favorites, trips_changed, favorites_changed))
+
+# 沒有計數列的使用者視為版本 0
+TRIPS_VERSION_SQL = "SELECT trips_version FROM user_counters WHERE Users_id = %s"
+FAVORITES_VERSION_SQL = "SELECT favorites_version FROM user_counters WHERE Users_id = %s"
+
+def _version(row, column):
+    if row is None:
+        return 0
+    return row[column] if isinstance(row, dict) else row[0]
+
+def get_trips_version(cursor, user_id):
+    cursor.execute(TRIPS_VERSION_SQL, (user_id,))
+    return _version(cursor.fetchone(), 'trips_version')
+
+def get_favorites_version(cursor, user_id):
+    cursor.execute(FAVORITES_VERSION_SQL, (user_id,))
+    return _version(cursor.fetchone(), 'favorites_version')
+
+def favorites_etag(user_id, version):
+    return derive_etag('favorites', user_id, version)
+
+def check_and_repair(conn):
+    # 找出與 trips / favorites 實際筆數不一致的計數並修正，回傳修正筆數；
+    # 沒有計數列的使用者視為 0 (登入時以 COALESCE 補 0)，只有實際有行程或收藏時才補建
+    cursor = conn.cursor()
+    try:
+        ensure_table(cursor)
+        cursor.execute("""
+            SELECT u.id, COALESCE(t.cnt, 0), COALESCE(f.cnt, 0)
+            FROM users u
+            LEFT JOIN user_counters c ON c.Users_id = u.id
+            LEFT JOIN (SELECT Users_id, COUNT(*) AS cnt FROM trips GROUP BY Users_id) t
+                ON t.Users_id = u.id
+            LEFT JOIN (SELECT Users_id, COUNT(*) AS cnt FROM favorites GROUP BY Users_id) f
+                ON f.Users_id = u.id
+            WHERE COALESCE(c.total_trips, 0) <> COALESCE(t.cnt, 0)
+               OR COALESCE(c.total_favorites, 0) <> COALESCE(f.cnt, 0)
+        """)
+        drifted = cursor.fetchall()
+        if drifted:
+            cursor.executemany("""
+                INSERT INTO user_counters (Users_id, total_trips, total_favorites)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    total_trips = VALUES(total_trips),
+                    total_favorites = VALUES(total_favorites)
+            """, drifted)
+        conn.commit()
+        return len(drifted)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def init_user_counters():
+    conn = get_db_connection(readonly=False)
+    cursor = conn.cursor()
+    try:
+        created = ensure_table(cursor)
+    finally:
+        cursor.close()
+    try:
+        if created:
+            check_and_repair(conn)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    # 用法：python user_counters.py check  (可排入 cron 定期執行)
+    if sys.argv[1:] != ['check']:
+        print("用法：python user_counters.py check")
+        sys.exit(1)
+    conn = get_db_connection(readonly=False)
+    try:
+        print(f"已修正 {check_and_repair(conn)} 位使用者的計數")
+    finally:
+        conn.close()